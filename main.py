@@ -5,20 +5,47 @@ import os  # Используется для работы с операцион
 import wx  # Библиотека для создания графического интерфейса пользователя (GUI).
 import sys  # Предоставляет доступ к некоторым переменным и функциям, взаимодействующим с интерпретатором Python.
 import time  # Модуль для работы со временем, включая задержки и измерение времени.
-# import ctypes  # Модуль, который позволяет вызывать функции из динамически загружаемых библиотек (DLL на Windows, .so на Linux).
+import ctypes  # Модуль, который позволяет вызывать функции из динамически загружаемых библиотек (DLL на Windows, .so на Linux).
+import stat  # Константы и функции для разбора результатов os.stat (типы файлов, права доступа).
 import shutil  # Предназначен для высокого уровня операций с файлами и каталогами, таких как копирование, удаление и перемещение.
 import fnmatch  # Модуль для сравнения строк с шаблонами UNIX-стиля (*, ?, [seq], [!seq]).
+import re  # Регулярные выражения.
+import json  # Кодирование команд и ответов сервера управления.
+import socket  # Unix-сокет сервера управления.
+import heapq  # Очередь с приоритетом (куча) и слияние отсортированных последовательностей.
+import hashlib  # Хэши содержимого файлов для поиска дубликатов.
+import mmap  # Чтение больших файлов через отображение в память.
+import array  # Компактные массивы чисел (хранилище кандидатов на удаление).
+import pickle  # Сериализация объектов Python (используется для сброса данных во временные файлы).
+import tarfile  # Архивы tar для архивирования перед удалением.
+import queue  # Очереди между обходом и потоками архивирования.
 import logging  # Стандартный модуль для логирования событий программы.
 import datetime  # Модуль для работы с датой и временем.
 import platform  # Модуль для определения информации об операционной системе.
+import tempfile  # Создание временных файлов и каталогов.
 import threading  # Модуль для работы с потоками выполнения.
+import argparse  # Разбор аргументов командной строки.
+import itertools  # Инструменты для итераторов (чтение каталогов порциями).
+import errno  # Коды системных ошибок.
 import configparser  # Модуль для чтения и записи конфигурационных файлов.
+from dataclasses import dataclass, field, replace  # Декоратор и функции для классов-структур данных.
+from concurrent.futures import ThreadPoolExecutor  # Пул потоков для параллельного выполнения задач.
 from pathlib import Path  # Объектно-ориентированный подход к работе с путями файловой системы.
 
 # Внешние библиотеки
 from pystray import Icon, Menu, MenuItem  # Библиотека для создания иконок в системном трее.
 from PIL import Image  # Библиотека для обработки изображений.
 
+try:  # Необязательная библиотека для векторной обработки пакетов файлов
+    import numpy as np
+except ImportError:
+    np = None
+
+try:  # Необязательная библиотека для архивов tar.zst
+    import zstandard
+except ImportError:
+    zstandard = None
+
 
 
 def resource_path(relative_path, is_output_dir=False):
@@ -58,13 +85,474 @@ def get_days_ending(number):
         return "дней"
 
 
+def format_size(size):
+    """
+    Форматирование размера в байтах в удобочитаемый вид (Б, КБ, МБ, ГБ, ТБ).
+    """
+    for unit in ["Б", "КБ", "МБ", "ГБ"]:
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "Б" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ТБ"
+
+
+def parse_size(value):
+    """
+    Преобразование строки размера ("500M", "20 GB", "1024") в количество байт.
+    Поддерживаются суффиксы K, M, G, T (с необязательным B), регистр не учитывается.
+    """
+    value = str(value).strip().strip('"').upper().replace(" ", "")
+    if value.endswith("B"):
+        value = value[:-1]
+    multipliers = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    if value and value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(float(value))
+
+
+def parse_duration(value):
+    """
+    Преобразование строки длительности ("12h", "2d", "3w", "6m", "1y") в секунды.
+    Число без суффикса считается количеством дней. m - 30 дней, y - 365 дней.
+    """
+    value = str(value).strip().lower()
+    multipliers = {"h": 3600, "d": 86400, "w": 7 * 86400, "m": 30 * 86400, "y": 365 * 86400}
+    if value and value[-1] in multipliers:
+        return float(value[:-1]) * multipliers[value[-1]]
+    return float(value) * 86400
+
+
+def format_duration(seconds):
+    """
+    Форматирование длительности в секундах в читаемый вид (например, "1 д 2 ч 5 мин").
+    """
+    seconds = int(seconds)
+    parts = [(seconds // 86400, "д"), (seconds % 86400 // 3600, "ч"), (seconds % 3600 // 60, "мин")]
+    return " ".join(f"{value} {unit}" for value, unit in parts if value) or f"{seconds} сек"
+
+
+RETENTION_PERIODS = ("all", "hour", "day", "week", "month", "year")
+
+
+def parse_retention(value):
+    """
+    Разбор многоуровневой схемы хранения вида "2d:all, 14d:day, 90d:week".
+    Каждый уровень - пара "возраст:период": элементы моложе указанного возраста хранятся по одному на период
+    (all - все элементы). Возвращает список (возраст в секундах, период), отсортированный по возрасту.
+    """
+    tiers = []
+    for part in str(value).strip('"').split(","):
+        if not part.strip():
+            continue
+        age, _, period = part.strip().partition(":")
+        period = period.strip().lower()
+        if period not in RETENTION_PERIODS:
+            raise ValueError(f"Неизвестный период хранения '{period}'. Доступные значения: {', '.join(RETENTION_PERIODS)}")
+        tiers.append((parse_duration(age), period))
+    return sorted(tiers)
+
+
+def get_retention_bucket(timestamp, period):
+    """
+    Возвращает ключ календарного периода (час, день, ISO-неделя, месяц, год), в который попадает timestamp.
+    """
+    date = datetime.datetime.fromtimestamp(timestamp)
+    if period == "hour":
+        return date.year, date.month, date.day, date.hour
+    if period == "day":
+        return date.year, date.month, date.day
+    if period == "week":
+        return tuple(date.isocalendar())[:2]
+    if period == "month":
+        return date.year, date.month
+    return date.year
+
+
+@dataclass(frozen=True)
+class IntervalSchedule:
+    """
+    Расписание с фиксированным интервалом между запусками (Schedule = 6h).
+    """
+    seconds: float
+
+    def next_run(self, after):
+        return after + self.seconds
+
+
+
+@dataclass(frozen=True)
+class CronSchedule:
+    """
+    Расписание в формате cron из пяти полей: минуты, часы, дни месяца, месяцы, дни недели (0 и 7 - воскресенье).
+    Поддерживаются "*", числа, диапазоны "a-b", шаг "*/n" и "a-b/n" и списки через запятую.
+    Если заданы и дни месяца, и дни недели, достаточно совпадения любого из них (как в cron).
+    """
+    minutes: frozenset
+    hours: frozenset
+    days: frozenset
+    months: frozenset
+    weekdays: frozenset
+    any_day: bool
+    any_weekday: bool
+
+    @staticmethod
+    def parse_field(field, low, high):
+        values = set()
+        for part in field.split(","):
+            base, _, step = part.partition("/")
+            if base == "*":
+                start, end = low, high
+            elif "-" in base:
+                start, end = (int(value) for value in base.split("-", 1))
+            else:
+                start = end = int(base)
+            if not low <= start <= end <= high:
+                raise ValueError(f"значение {part} вне диапазона {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return frozenset(values)
+
+
+    @classmethod
+    def parse(cls, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"выражение cron должно содержать 5 полей: {expression}")
+        weekdays = frozenset(day % 7 for day in cls.parse_field(fields[4], 0, 7))
+        return cls(
+            minutes=cls.parse_field(fields[0], 0, 59), hours=cls.parse_field(fields[1], 0, 23),
+            days=cls.parse_field(fields[2], 1, 31), months=cls.parse_field(fields[3], 1, 12), weekdays=weekdays,
+            any_day=fields[2] == "*", any_weekday=fields[4] == "*",
+        )
+
+
+    def day_matches(self, moment):
+        day_match = moment.day in self.days
+        weekday_match = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_match and weekday_match
+        return day_match or weekday_match
+
+
+    def next_run(self, after):
+        """
+        Ближайшее время запуска (timestamp) строго после after. Несовпадающие месяцы, дни и часы пропускаются целиком.
+        """
+        moment = datetime.datetime.fromtimestamp(after).replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = moment + datetime.timedelta(days=5 * 366)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self.day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + datetime.timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += datetime.timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError("расписание cron никогда не срабатывает")
+
+
+
+def parse_schedule(value):
+    """
+    Разбор расписания секции: интервал в формате parse_duration ("6h", "1d", "1w")
+    или выражение cron из пяти полей ("0 3 * * *" - каждый день в 03:00).
+    Выражение cron, которое никогда не срабатывает (например, "0 0 30 2 *"), отклоняется при разборе.
+    """
+    value = str(value).strip().strip('"')
+    if len(value.split()) == 5:
+        schedule = CronSchedule.parse(value)
+        schedule.next_run(time.time())  # ValueError, если подходящего времени нет
+        return schedule
+    seconds = parse_duration(value)
+    if seconds <= 0:
+        raise ValueError(f"интервал расписания должен быть больше 0: {value}")
+    return IntervalSchedule(seconds)
+
+
+def get_control_socket_path(config):
+    """
+    Путь к Unix-сокету сервера управления из параметра control-socket секции [SETTINGS] (None - сервер отключён).
+    Относительный путь отсчитывается от каталога программы.
+    """
+    value = config.get("SETTINGS", "control-socket", fallback="").strip().strip('"')
+    if not value:
+        return None
+    return os.path.join(resource_path(".", is_output_dir=True), os.path.expandvars(value))
+
+
+def send_control_command(socket_path, command, timeout=10, **params):
+    """
+    Отправка команды серверу управления и получение ответа (используется аргументом командной строки --control).
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path)
+        client.sendall((json.dumps({"command": command, **params}, ensure_ascii=False) + "\n").encode("utf-8"))
+        with client.makefile("r", encoding="utf-8") as reader:
+            return json.loads(reader.readline())
+
+
+def get_journal_path(config):
+    """
+    Путь к журналу удалений из параметра journal-file секции [SETTINGS] (None - журнал отключён параметром journal).
+    Относительный путь отсчитывается от каталога программы.
+    """
+    if not config.getboolean("SETTINGS", "journal", fallback=False):
+        return None
+    value = config.get("SETTINGS", "journal-file", fallback="deletions.jsonl").strip().strip('"') or "deletions.jsonl"
+    return os.path.join(resource_path(".", is_output_dir=True), os.path.expandvars(value))
+
+
+def read_journal(journal_path):
+    """
+    Генератор записей журнала удалений. Строки, повреждённые при аварийном завершении (последняя строка
+    без перевода строки или с неполным JSON), пропускаются.
+    Пути, не являющиеся корректным UTF-8, записаны исходными байтами и читаются через surrogateescape, как os.fsdecode.
+    """
+    with open(journal_path, "rb") as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                yield json.loads(line.decode("utf-8", "surrogateescape"))
+            except ValueError:
+                continue
+
+
+def query_journal(journal_path, sections=None, since=None, mask=None):
+    """
+    Вывод записей журнала удалений в консоль (аргумент командной строки --journal) с отбором по секциям,
+    возрасту записи (since - длительность, например "1d") и маске пути. Возвращает количество выведенных записей.
+    """
+    since_ts = time.time() - parse_duration(since) if since else None
+    mask = compile_mask((mask,)) if mask else None
+    count = total = 0
+    for record in read_journal(journal_path):
+        if sections and record.get("section") not in sections:
+            continue
+        if since_ts and record.get("ts", 0) < since_ts:
+            continue
+        if mask and not mask.match(record.get("path", "")):
+            continue
+        count += 1
+        total += record.get("size") or 0
+        action = "карантин" if record.get("quarantine") else "каталог" if record.get("dir") else "файл"
+        path = str(record.get("path")).encode("utf-8", "surrogateescape").decode("utf-8", "backslashreplace")  # Некорректные байты выводятся как \xNN
+        print(
+            f"{datetime.datetime.fromtimestamp(record.get('ts', 0)).strftime('%Y-%m-%d %H:%M:%S')}"
+            f"  [{record.get('section')}] метод {record.get('method')}  {action}  {format_size(record.get('size') or 0)}  {path}"
+        )
+    print(f"Записей: {count}, объём: {format_size(total)}.")
+    return count
+
+
+IS_WINDOWS = platform.system() == "Windows"
+IS_LINUX = platform.system() == "Linux"
+TIME_SOURCES = ("birth", "mtime", "atime", "ctime")
+SYMLINK_POLICIES = ("remove", "skip", "follow")
+DUPLICATE_POLICIES = ("oldest", "newest", "shortest-path")  # Какая копия сохраняется в режиме Duplicates
+ARCHIVE_FORMATS = ("gz", "xz", "zst")  # Сжатие архивов Archive (zst - при установленной библиотеке zstandard)
+METHODS = ("0", "1", "2", "3", "4")
+DEFAULT_GROUP_BY = r"^(.+?)(?:\.\d+)*$"  # Ключ группы KeepLast по умолчанию: имя без номеров ротации (app.log.1 -> app.log)
+
+
+class StatxTimestamp(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_int64), ("tv_nsec", ctypes.c_uint32), ("reserved", ctypes.c_int32)]
+
+
+class Statx(ctypes.Structure):
+    """
+    Структура struct statx ядра Linux (см. man 2 statx).
+    """
+    _fields_ = [
+        ("stx_mask", ctypes.c_uint32), ("stx_blksize", ctypes.c_uint32), ("stx_attributes", ctypes.c_uint64),
+        ("stx_nlink", ctypes.c_uint32), ("stx_uid", ctypes.c_uint32), ("stx_gid", ctypes.c_uint32),
+        ("stx_mode", ctypes.c_uint16), ("spare0", ctypes.c_uint16),
+        ("stx_ino", ctypes.c_uint64), ("stx_size", ctypes.c_uint64), ("stx_blocks", ctypes.c_uint64),
+        ("stx_attributes_mask", ctypes.c_uint64),
+        ("stx_atime", StatxTimestamp), ("stx_btime", StatxTimestamp),
+        ("stx_ctime", StatxTimestamp), ("stx_mtime", StatxTimestamp),
+        ("stx_rdev_major", ctypes.c_uint32), ("stx_rdev_minor", ctypes.c_uint32),
+        ("stx_dev_major", ctypes.c_uint32), ("stx_dev_minor", ctypes.c_uint32),
+        ("spare2", ctypes.c_uint64 * 14),
+    ]
+
+
+AT_FDCWD = -100
+AT_SYMLINK_NOFOLLOW = 0x100
+STATX_MTIME = 0x40
+STATX_SIZE = 0x200
+STATX_BTIME = 0x800
+
+
+def load_statx():
+    """
+    Возвращает функцию statx из libc (glibc 2.28+) или None, если она недоступна.
+    """
+    if not IS_LINUX:
+        return None
+    try:
+        func = ctypes.CDLL(None, use_errno=True).statx
+    except (AttributeError, OSError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_uint, ctypes.POINTER(Statx)]
+    func.restype = ctypes.c_int
+    return func
+
+
+LIBC_STATX = load_statx()
+
+
+def statx_time_and_size(path):
+    """
+    Возвращает (время создания, размер) файла через системный вызов statx одним обращением к файловой системе.
+    Если файловая система не хранит время создания, возвращается время последней модификации.
+    """
+    buffer = Statx()
+    if LIBC_STATX(AT_FDCWD, os.fsencode(path), AT_SYMLINK_NOFOLLOW, STATX_BTIME | STATX_MTIME | STATX_SIZE, ctypes.byref(buffer)) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error), os.fspath(path))
+    timestamp = buffer.stx_btime if buffer.stx_mask & STATX_BTIME else buffer.stx_mtime
+    return timestamp.tv_sec + timestamp.tv_nsec / 1e9, buffer.stx_size
+
+
+def get_mount_points():
+    """
+    Возвращает множество точек монтирования из /proc/self/mountinfo (Linux) или None, если список недоступен.
+    Пробелы и другие специальные символы в путях записаны восьмеричными последовательностями (\\040).
+    """
+    try:
+        with open("/proc/self/mountinfo", encoding="utf-8", errors="surrogateescape") as file:
+            return {
+                re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), line.split()[4])
+                for line in file if len(line.split()) > 4
+            }
+    except OSError:
+        return None
+
+
+def read_io_pressure():
+    """
+    Возвращает давление ввода-вывода из /proc/pressure/io (Linux 4.20+, PSI): пару (some, full) - доля времени в процентах
+    за последние 10 секунд, когда хотя бы одна (some) или все (full) задачи ждали диск. None, если PSI недоступен.
+    """
+    try:
+        with open("/proc/pressure/io", encoding="ascii") as file:
+            values = {line.split()[0]: dict(field.split("=") for field in line.split()[1:]) for line in file if line.strip()}
+        return float(values["some"]["avg10"]), float(values.get("full", {}).get("avg10", 0))
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def get_stat_time(stats, time_source="birth"):
+    """
+    Возвращает время из результата os.stat в соответствии с источником времени (birth, mtime, atime, ctime).
+    Время создания берётся из st_birthtime (Windows с Python 3.12+, macOS, BSD), на Windows без него - из st_ctime.
+    """
+    if time_source == "mtime":
+        return stats.st_mtime
+    if time_source == "atime":
+        return stats.st_atime
+    if time_source == "ctime":
+        return stats.st_ctime
+    birthtime = getattr(stats, "st_birthtime", None)
+    if birthtime is not None:
+        return birthtime
+    return stats.st_ctime if IS_WINDOWS else stats.st_mtime
+
+
+def compile_mask(mask_patterns):
+    """
+    Компиляция набора шаблонов Mask в одно регулярное выражение (без учёта регистра).
+    """
+    return re.compile("|".join(f"(?:{fnmatch.translate(pattern.lower())})" for pattern in mask_patterns), re.IGNORECASE)
+
+
+class PathMask:
+    """
+    Автомат для масок с путями относительно каталога правила (`**/cache/*.tmp`, `build/*/obj/**`).
+    Шаблон разбивается на компоненты, состояние автомата - множество позиций (номер шаблона, номер компонента).
+    Маска без разделителя пути соответствует имени файла на любой глубине (как `**/маска`).
+    Пустое состояние означает, что в поддереве ничего не может совпасть, и каталог не обходится.
+    """
+    __slots__ = ("patterns", "start")
+
+    def __init__(self, mask_patterns):
+        patterns = []
+        for pattern in mask_patterns:
+            parts = [part for part in re.split(r"[\\/]+", pattern) if part and part != "."]
+            if len(parts) == 1 and parts[0] != "**":
+                parts.insert(0, "**")
+            patterns.append(tuple(part if part == "**" else compile_mask((part,)) for part in parts))
+        self.patterns = tuple(patterns)
+        self.start = self.closure((index, 0) for index in range(len(self.patterns)))
+
+
+    def closure(self, positions):
+        """
+        Добавление позиций после компонентов `**`, которые могут соответствовать пустой последовательности каталогов.
+        """
+        state = set()
+        for index, position in positions:
+            parts = self.patterns[index]
+            while position < len(parts) and (index, position) not in state:
+                state.add((index, position))
+                if parts[position] != "**":
+                    break
+                position += 1
+        return frozenset(state)
+
+
+    def step(self, state, dir_name):
+        """
+        Переход в подкаталог с указанным именем. Возвращает новое состояние (пустое - поддерево не обходится).
+        """
+        positions = []
+        for index, position in state:
+            parts = self.patterns[index]
+            part = parts[position]
+            if part == "**":
+                positions.append((index, position))
+            elif position < len(parts) - 1 and part.match(dir_name):
+                positions.append((index, position + 1))
+        return self.closure(positions)
+
+
+    def match(self, state, file_name):
+        """
+        Проверка соответствия файла с указанным именем маске в текущем состоянии.
+        """
+        for index, position in state:
+            parts = self.patterns[index]
+            if position == len(parts) - 1 and (parts[position] == "**" or parts[position].match(file_name)):
+                return True
+        return False
+
+
+
+def normalize_path(path):
+    """
+    Приведение пути к единому виду для сравнения: раскрытие переменных среды, нормализация разделителей и регистра.
+    """
+    return os.path.normcase(os.path.normpath(os.path.expandvars(str(path).strip('"'))))
+
+
 class Mr_Clean:
-    def __init__(self):
+    def __init__(self, daemon=None, headless=None):
         """
         Инициализация программы.
+
+        :param daemon: Резидентный режим с запуском секций по расписанию (None - значение из config.cfg).
+        :param headless: Работа без окна и иконки в трее (None - значение из config.cfg).
         """
         self.PROGRAM_NAME = "Mr. Clean"
         self.PROGRAM_VERSION = "1.3"
+        self.DISK_USAGE_CHECK_INTERVAL = 256  # Через сколько удалений принудительно проверять свободное место на диске
+        self.QUOTA_BUCKET_SEC = 3600  # Ширина корзины гистограммы возраста для режима MaxSize (в секундах)
+        self.CONFIG_CHECK_INTERVAL = 5  # Как часто в резидентном режиме проверять изменение файлов конфигурации (в секундах)
+        self.DIR_INDEX_TTL = 86400  # Максимальное время, в течение которого каталог может пропускаться по индексу (в секундах)
 
         # Временный базовый логгер
         logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -78,18 +566,38 @@ class Mr_Clean:
             config_file = resource_path("config.cfg", is_output_dir=True)
             values_file = resource_path("values.ini", is_output_dir=True)
 
+            self.config_mtimes = self.get_config_mtimes()
             self.config = self.load_config(config_file)
             self.values_config = self.load_config(values_file)
+            self.rule_table = RuleTable.from_config(self.values_config, self.logger)  # Правила очистки компилируются один раз
 
             # Инициализация параметров
-            self.cycle_time_limit_sec = int(self.config["SETTINGS"]["cycle-time-limit-sec"])
+            # Флаги остановки задаются до apply_settings: запущенный в нём AdaptiveThrottle читает их через stop_requested
+            self.is_forced_exit = False  # Флаг для проверки принудительного выхода
+            self.is_cancelled = False  # Флаг отмены текущего запуска (команда cancel), программа продолжает работу
+            self.throttle = None  # Адаптивное ограничение нагрузки сохраняется при перечитывании конфигурации
+            self.apply_settings()
+            self.daemon = self.config.getboolean("SETTINGS", "daemon", fallback=False) if daemon is None else daemon
+            self.headless = self.config.getboolean("SETTINGS", "headless", fallback=False) if headless is None else headless
+            self.dir_index = {} if self.daemon else None  # Индекс каталогов сохраняется между запусками резидентного режима
+            self.run_requests = set()  # Секции, запуск которых запрошен вне расписания (None - все секции)
+            self.wake_event = threading.Event()  # Пробуждение цикла резидентного режима
+            self.next_runs = {}  # Время следующего запуска каждого правила в резидентном режиме
+            self.current_sections = None  # Секции, которые обрабатываются в данный момент
+            self.config_lock = threading.Lock()
+            self.progress = RunProgress()  # Ход текущего (или последнего) запуска
+            self.report = None  # Отчёт о занятом месте текущего (или последнего) запуска (SpaceReport)
+            self.hash_cache = None  # Кэш хэшей режима Duplicates, загружается при первом обращении
+            self.run_stats_file = resource_path("run_stats.json", is_output_dir=True)
+            self.run_stats = self.load_run_stats()  # Количество элементов предыдущих запусков для оценки ETA
+            self.metrics = {"runs": 0, "last_run_started": None, "last_run_duration": None, **dict.fromkeys(RunProgress.COUNTERS, 0)}
             self.logging_enabled = self.config["LOG"]["logging"].lower() == "true"
             self.log_level = self.config["LOG"]["log-level"].upper()
             self.log_days_limit = int(self.config["LOG"]["log-days-limit"])
 
-            # Создаем GUI окно
-            self.app = wx.App(False)
-            self.main_window = MainWindow(
+            # Создаем GUI окно (без окна и иконки в трее в режиме headless)
+            self.app = None if self.headless else wx.App(False)
+            self.main_window = None if self.headless else MainWindow(
                 None,
                 title=f"{self.PROGRAM_NAME} v{self.PROGRAM_VERSION}",
                 log_level=self.log_level,  # Передаем уровень логирования
@@ -97,8 +605,10 @@ class Mr_Clean:
             )
 
             self.setup_logging()  # Настройка основного логгера
-            self.icon = self.tray_start_mr_clean()  # Создание иконки в системном трее
-            self.is_forced_exit = False  # Флаг для проверки принудительного выхода
+            self.icon = None if self.headless else self.tray_start_mr_clean()  # Создание иконки в системном трее
+            self.control_server = self.start_control_server(get_control_socket_path(self.config))
+            self.journal = self.open_journal(get_journal_path(self.config))
+            self.quarantine = self.start_quarantine()
 
         except KeyError as e:
             self.logger.error(f"Критическая ошибка: Отсутствует ключ {e} в конфигурационном файле.")
@@ -108,6 +618,182 @@ class Mr_Clean:
             raise
 
 
+    def apply_settings(self):
+        """
+        Применение параметров секции [SETTINGS], которые можно менять без перезапуска программы.
+        """
+        self.cycle_time_limit_sec = int(self.config["SETTINGS"]["cycle-time-limit-sec"])
+        self.remove_workers = self.config.getint("SETTINGS", "remove-workers", fallback=4)
+        self.archive_workers = max(1, self.config.getint("SETTINGS", "archive-workers", fallback=2))
+        self.batch_size = self.config.getint("SETTINGS", "batch-size", fallback=4096)
+        self.use_numpy = self.config.getboolean("SETTINGS", "numpy", fallback=True) and np is not None
+        self.daemon_interval = parse_duration(self.config.get("SETTINGS", "daemon-interval", fallback="1d"))
+        self.progress_interval = self.config.getfloat("SETTINGS", "progress-interval", fallback=1)
+        self.report_top = self.config.getint("SETTINGS", "report-top", fallback=10)
+        self.spill_dir = os.path.expandvars(self.config.get("SETTINGS", "spill-dir", fallback="").strip().strip('"')) or None
+        self.tree_remover = TreeRemover(self.remove_workers, stop_check=lambda: self.stop_requested)
+        self.throttle = self.start_throttle()
+        self.rate_limiter = self.create_rate_limiter(
+            self.config.getfloat("SETTINGS", "ops-per-sec", fallback=0),
+            parse_size(self.config.get("SETTINGS", "bytes-per-sec", fallback="0") or "0"),
+            self.throttle.limiter if self.throttle else None,
+        )
+        self.rate_limiters = {}  # Ограничители секций (Rule -> RateLimiter), создаются при первом обращении
+
+
+    def start_throttle(self):
+        """
+        Запуск адаптивного ограничения нагрузки (параметр adaptive-throttle) или обновление его порогов при перечитывании
+        конфигурации. Возвращает AdaptiveThrottle или None.
+        """
+        throttle = self.throttle
+        if not self.config.getboolean("SETTINGS", "adaptive-throttle", fallback=False):
+            if throttle:
+                throttle.stop()
+            return None
+        high = self.config.getfloat("SETTINGS", "io-pressure-high", fallback=20)
+        low = self.config.getfloat("SETTINGS", "io-pressure-low", fallback=5)
+        if throttle:
+            throttle.high, throttle.low = high, low
+            if throttle.workers:
+                self.tree_remover.workers = throttle.workers
+            return throttle
+        if not AdaptiveThrottle.available():
+            self.logger.warning("Давление ввода-вывода и загрузка системы недоступны — адаптивное ограничение не запущено.")
+            return None
+        throttle = AdaptiveThrottle(self, high, low)
+        throttle.start()
+        self.logger.info(f"Адаптивное ограничение нагрузки включено (давление: выше {high}% - снижение, ниже {low}% - рост).")
+        return throttle
+
+
+    def create_rate_limiter(self, ops_per_sec, bytes_per_sec, parent=None):
+        """
+        Создание ограничителя скорости. Возвращает parent, если собственные лимиты не заданы (0 - без ограничения).
+        """
+        if not ops_per_sec and not bytes_per_sec:
+            return parent
+        return RateLimiter(ops_per_sec, bytes_per_sec, parent, stop_check=lambda: self.stop_requested)
+
+
+    def get_rate_limiter(self, rule=None):
+        """
+        Ограничитель скорости правила: лимиты секции вместе с общими лимитами [SETTINGS].
+        Возвращает None, если лимиты не заданы. Бюджет секции сохраняется между группами и запусками.
+        """
+        if rule is None:
+            return self.rate_limiter
+        if rule not in self.rate_limiters:
+            self.rate_limiters[rule] = self.create_rate_limiter(rule.ops_per_sec, rule.bytes_per_sec, self.rate_limiter)
+        return self.rate_limiters[rule]
+
+
+    @property
+    def stop_requested(self):
+        """
+        Текущий запуск нужно прервать: принудительное завершение программы или команда cancel.
+        """
+        return self.is_forced_exit or self.is_cancelled
+
+
+    def start_quarantine(self):
+        """
+        Включение карантина (параметр quarantine) и запуск фоновой очистки карантина. Возвращает Quarantine или None.
+        """
+        if not self.config.getboolean("SETTINGS", "quarantine", fallback=False):
+            return None
+        quarantine = Quarantine(
+            self,
+            self.config.get("SETTINGS", "quarantine-dir", fallback=".mr_clean_quarantine").strip().strip('"'),
+            parse_duration(self.config.get("SETTINGS", "quarantine-grace", fallback="0")),
+            resource_path("quarantine.json", is_output_dir=True),
+        )
+        QuarantinePurger(quarantine, stop_check=lambda: self.is_forced_exit).start()
+        self.logger.info(f"Карантин включён, льготный период: {format_duration(quarantine.grace_sec)}.")
+        return quarantine
+
+
+    def open_journal(self, journal_path):
+        """
+        Открытие журнала удалений, если он включён параметром journal. Возвращает DeletionJournal или None.
+        """
+        if not journal_path:
+            return None
+        try:
+            journal = DeletionJournal(journal_path, self.config.getfloat("SETTINGS", "journal-fsync-interval", fallback=1))
+        except OSError as e:
+            self.logger.error(f"Не удалось открыть журнал удалений {journal_path}: {e}")
+            return None
+        self.logger.info(f"Журнал удалений: {journal_path}")
+        return journal
+
+
+    def start_control_server(self, socket_path):
+        """
+        Запуск сервера управления на Unix-сокете, если задан параметр control-socket. Возвращает сервер или None.
+        """
+        if not socket_path:
+            return None
+        if not hasattr(socket, "AF_UNIX"):
+            self.logger.error("Unix-сокеты не поддерживаются в этой системе — сервер управления не запущен.")
+            return None
+        try:
+            server = ControlServer(self, socket_path)
+        except (OSError, RuntimeError) as e:
+            self.logger.error(f"Не удалось запустить сервер управления {socket_path}: {e}")
+            return None
+        server.start()
+        self.logger.info(f"Сервер управления запущен: {socket_path}")
+        return server
+
+
+    def get_config_mtimes(self):
+        """
+        Возвращает время изменения файлов config.cfg и values.ini (None для отсутствующего файла).
+        """
+        mtimes = {}
+        for name in ("config.cfg", "values.ini"):
+            try:
+                mtimes[name] = os.stat(resource_path(name, is_output_dir=True)).st_mtime_ns
+            except OSError:
+                mtimes[name] = None
+        return mtimes
+
+
+    def reload_config(self, force=False):
+        """
+        Перечитывание config.cfg и values.ini, если время их изменения отличается от сохранённого (или force).
+        Правила компилируются заново, индекс каталогов сбрасывается. Параметры [LOG] применяются после перезапуска.
+        Возвращает True, если конфигурация перечитана.
+        """
+        with self.config_lock:
+            return self.reload_config_locked(force)
+
+
+    def reload_config_locked(self, force):
+        mtimes = self.get_config_mtimes()
+        if not force and mtimes == self.config_mtimes:
+            return False
+
+        self.logger.info("Файлы конфигурации изменились — перечитываем." if not force else "Перечитывание файлов конфигурации.")
+        try:
+            config = self.load_config(resource_path("config.cfg", is_output_dir=True))
+            values_config = self.load_config(resource_path("values.ini", is_output_dir=True))
+            int(config["SETTINGS"]["cycle-time-limit-sec"])  # Проверка обязательного параметра до применения
+        except Exception as e:
+            self.logger.error(f"Ошибка при перечитывании конфигурации: {e}. Используются прежние параметры.")
+            self.config_mtimes = mtimes  # Повторная попытка - после следующего изменения файлов
+            return False
+
+        self.config_mtimes = mtimes
+        self.config, self.values_config = config, values_config
+        self.apply_settings()
+        self.rule_table = RuleTable.from_config(values_config, self.logger)
+        if self.dir_index is not None:
+            self.dir_index.clear()
+        return True
+
+
     def load_config(self, config_file):
         """
         Загрузка конфигурации из файла.
@@ -179,6 +865,7 @@ class Mr_Clean:
             image,
             menu=Menu(
                 MenuItem("Показать", lambda icon, item: self.show_gui(), default=True),
+                MenuItem("Запустить очистку", lambda icon, item: self.request_run(), visible=self.daemon),
                 MenuItem("О программе", lambda icon, item: os.system(f'start "" "https://github.com/AlexBor-89/Mr_Clean"')),
                 Menu.SEPARATOR,
                 MenuItem("Выход", lambda icon, item: self.tray_stop_mr_clean(self.icon, exit_source="manual")),
@@ -210,6 +897,9 @@ class Mr_Clean:
         :param exit_source: Источник вызова ("manual" - через кнопку, "auto" - автоматически).
         """
         self.is_forced_exit = exit_source == "manual"  # Устанавливаем флаг принудительного выхода при ручном вызове
+        self.wake_event.set()  # Резидентный режим не ждёт следующего запуска по расписанию
+        if self.control_server:
+            self.control_server.close()
 
         self.logger.info("(\\_/)")
         self.logger.info("(•.•)")
@@ -251,50 +941,196 @@ class Mr_Clean:
                 sys.exit()
 
         # Выполняем shutdown через главный поток с задержкой в 3 секунды
-        if threading.current_thread() is threading.main_thread():  # Через окно (Завершить работу)
+        if threading.current_thread() is threading.main_thread() and self.app:  # Через окно (Завершить работу)
             wx.CallLater(3000, delayed_shutdown)
         else:  # Через трей (Выход)
             time.sleep(3)
             delayed_shutdown()
 
 
-    def get_creation_time(self, file_path):  # Функция для получения времени создания файла (кроссплатформенная)
+    def cancel_run(self):
         """
-        Получает время создания файла, используя st_birthtime на macOS/Linux и st_ctime на Windows.
+        Отмена текущего запуска (команда cancel): обход прерывается, программа продолжает работу.
+        Возвращает False, если очистка сейчас не выполняется.
         """
-        if platform.system() == "Windows":
-            # На Windows st_ctime возвращает время создания файла
-            return os.path.getctime(file_path)
-        else:
-            # На macOS/Linux используем st_birthtime, если доступно
+        if self.current_sections is None:
+            return False
+        self.is_cancelled = True
+        self.logger.warning(f"Запуск секций {', '.join(self.current_sections)} отменён.")
+        return True
+
+
+    def get_status(self):
+        """
+        Состояние программы для сервера управления.
+        """
+        format_time = lambda timestamp: datetime.datetime.fromtimestamp(timestamp).isoformat(timespec="seconds") if timestamp and timestamp < float("inf") else None
+        return {
+            "program": self.PROGRAM_NAME,
+            "version": self.PROGRAM_VERSION,
+            "daemon": self.daemon,
+            "running": self.current_sections is not None,
+            "sections_running": self.current_sections,
+            "cancelled": self.is_cancelled,
+            "progress": self.progress.snapshot() if self.current_sections is not None else None,
+            "throttle": self.throttle.snapshot() if self.throttle else None,
+            "report": self.report.snapshot() if self.report else None,
+            "sections": [
+                {"section": rule.section, "path": rule.path, "method": rule.method, "mode": rule.mode,
+                 "next_run": format_time(self.next_runs.get(rule))}
+                for rule in self.rule_table
+            ],
+        }
+
+
+    def get_metrics(self):
+        """
+        Накопленные показатели всех запусков с учётом выполняемого в данный момент.
+        """
+        metrics = dict(self.metrics)
+        if self.current_sections is not None:
+            for name in RunProgress.COUNTERS:
+                metrics[name] += getattr(self.progress, name)
+        return metrics
+
+
+    def load_run_stats(self):
+        """
+        Загрузка количества элементов предыдущих запусков (run_stats.json) для оценки оставшегося времени.
+        """
+        try:
+            with open(self.run_stats_file, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Не удалось прочитать {self.run_stats_file}: {e}")
+            return {}
+
+
+    def save_run_stats(self):
+        try:
+            with open(self.run_stats_file, "w", encoding="utf-8") as file:
+                json.dump(self.run_stats, file, ensure_ascii=False, indent=2)
+        except OSError as e:
+            self.logger.warning(f"Не удалось сохранить {self.run_stats_file}: {e}")
+
+
+    def get_hash_cache(self):
+        """
+        Постоянный кэш хэшей файлов (hash_cache.json) для режима Duplicates, загружается один раз.
+        """
+        if self.hash_cache is None:
+            self.hash_cache = HashCache(resource_path("hash_cache.json", is_output_dir=True), self.logger)
+        return self.hash_cache
+
+
+    def show_progress(self, text):
+        """
+        Вывод строки хода очистки в строку состояния окна и подсказку иконки в трее.
+        """
+        if self.main_window:
+            wx.CallAfter(self.main_window.set_status, text)
+        if self.icon:
             try:
-                stats = os.stat(file_path)
-                if hasattr(stats, 'st_birthtime'):
-                    return stats.st_birthtime
-                else:
-                    # Если st_birthtime недоступно, используем st_mtime (время последней модификации)
-                    return stats.st_mtime
+                self.icon.title = f"{self.PROGRAM_NAME}\n{text}"[:127]  # Длина подсказки в трее Windows ограничена 128 символами
             except Exception as e:
-                raise ValueError(f"Не удалось получить время создания файла: {e}")
+                self.logger.debug(f"Ошибка при обновлении подсказки иконки в трее: {e}")
+
+
+    def get_creation_time(self, file_path, time_source="birth"):  # Функция для получения времени файла (кроссплатформенная)
+        """
+        Получает время файла по пути в соответствии с источником времени (birth, mtime, atime, ctime).
+        Время создания на Linux читается через statx, на Windows/macOS - из st_birthtime (st_ctime на Windows).
+        """
+        try:
+            if time_source == "birth" and LIBC_STATX:
+                return statx_time_and_size(file_path)[0]
+            return get_stat_time(os.stat(file_path), time_source)
+        except Exception as e:
+            raise ValueError(f"Не удалось получить время файла: {e}")
 
 
-    def safe_remove(self, path, is_dir=False):
+    def get_entry_time(self, entry, time_source="birth"):
+        """
+        Возвращает (время, размер) для os.DirEntry не более чем за одно обращение к файловой системе.
+        Для mtime/atime/ctime используется результат stat, сохранённый в DirEntry при сканировании
+        (на Windows он приходит вместе со списком каталога и не требует отдельного вызова).
+        Время создания на Linux читается одним вызовом statx.
+        """
+        if time_source == "birth" and LIBC_STATX:
+            return statx_time_and_size(entry.path)
+        stats = entry.stat(follow_symlinks=False)
+        return get_stat_time(stats, time_source), stats.st_size
+
+
+    def safe_remove(self, path, is_dir=False, size=None, quarantine=True, rule=None):
         """
         Метод предназначен для безопасного удаления файлов или каталогов.
+        Если включён карантин (и quarantine), элемент перемещается в каталог карантина и удаляется позже в фоне.
+        Каталоги удаляются параллельно через TreeRemover: ошибки отдельных элементов не прерывают удаление,
+        а собираются и выводятся в лог вместе с количеством удалённых элементов и освобождённым местом.
+        size - размер файла, если он уже известен (учитывается в освобождённом месте без дополнительных запросов).
+        rule - правило (секция), по которому удаляется элемент: удаление ждёт своей очереди в бюджете операций и байт
+        правила (RateLimiter) и записывается в журнал удалений.
+        Возвращает True, если элемент удалён полностью.
         """
+        progress = self.progress
+        limiter = self.get_rate_limiter(rule) if rule else None
+        journal = self.journal if rule else None
+        report = self.report if rule else None
         try:
+            if limiter and (not is_dir or quarantine and self.quarantine):
+                limiter.acquire(1, 0 if quarantine and self.quarantine else size or 0)  # Перемещение в карантин не освобождает место
+            if quarantine and self.quarantine and self.quarantine.move(path, is_dir):
+                progress.quarantined += 1
+                if journal:
+                    journal.write(path, size, rule, is_dir, quarantine=True)
+                if report:
+                    report.add_removed(path, size or 0, is_dir)
+                self.logger.info(f"Перемещён в карантин: {path}")
+                print(f"Перемещён в карантин: {path}")  # Вывод в консоль
+                return True
             if is_dir:
-                shutil.rmtree(path)
-            else:
-                os.remove(path)
-            self.logger.info(f"Удалён {'каталог' if is_dir else 'файл'}: {path}")
-            print(f"Удалён {'каталог' if is_dir else 'файл'}: {path}")  # Вывод в консоль
+                result = self.tree_remover.remove(path, limiter)
+                progress.dir_entries_removed += result.entries
+                progress.bytes_freed += result.bytes
+                progress.errors += len(result.errors)
+                if journal and result.entries:
+                    journal.write(path, result.bytes, rule, True, entries=result.entries, partial=bool(result.errors))
+                if report and result.entries:
+                    report.add_removed(path, result.bytes, True)
+                for error_path, error in result.errors:
+                    self.logger.error(f"Ошибка при удалении {error_path}: {error}")
+                if result.errors:
+                    self.logger.warning(
+                        f"Каталог {path} удалён частично. Удалено элементов: {result.entries},"
+                        f" освобождено: {format_size(result.bytes)}, ошибок: {len(result.errors)}."
+                    )
+                    return False
+                progress.dirs_removed += 1
+                self.logger.info(f"Удалён каталог: {path} (элементов: {result.entries}, освобождено: {format_size(result.bytes)})")
+                print(f"Удалён каталог: {path}")  # Вывод в консоль
+                return True
+            os.remove(path)
+            progress.files_removed += 1
+            progress.bytes_freed += size or 0
+            if journal:
+                journal.write(path, size, rule)
+            if report:
+                report.add_removed(path, size or 0)
+            self.logger.info(f"Удалён файл: {path}")
+            print(f"Удалён файл: {path}")  # Вывод в консоль
+            return True
         except PermissionError as e:
+            progress.errors += 1
             self.logger.error(f"Ошибка доступа при обработке {path}: {e}")
         except FileNotFoundError:
             self.logger.warning(f"Файл или каталог не найден: {path}")
         except Exception as e:
+            progress.errors += 1
             self.logger.error(f"Ошибка при обработке {path}: {e}")
+        return False
 
 
     def clean_logs_folder(self):
@@ -339,453 +1175,3286 @@ class Mr_Clean:
                     self.logger.error(f"Ошибка при обработке файла {log_file}: {e}")
 
 
-    def delete_files_and_folders(self, path, date):  # Метод 0
+    def select_expired(self, entries, date_ts, mask=None, time_source="birth", pending=None, with_size=False, limiter=None, cache=None):
         """
-        Удаляет файлы и каталоги с вложенными файлами, если они старше указанного количества дней.
+        Пакетная оценка файлов одного каталога: генератор файлов (os.DirEntry), которые старше date_ts и подходят под маску.
+        Файлы обрабатываются порциями по batch_size: сначала имена фильтруются скомпилированной маской (без обращения к диску),
+        затем время собирается в массив и сравнивается с границей одной векторной операцией NumPy (если библиотека доступна).
+        Удалению передаются только отобранные файлы. mask - скомпилированная маска (compile_mask), None означает все файлы.
+        Если передан список pending, в него добавляется наименьшее время неотобранных файлов каждого пакета.
+        При with_size генератор возвращает пары (файл, размер). limiter - ограничитель скорости запросов метаданных.
+        В словарь cache (если передан) записываются (время, размер) проверенных файлов по ключу (имя, источник времени).
         """
-        time_checker = TimeChecker(self.cycle_time_limit_sec)
-        time_checker.start()
+        for start in range(0, len(entries), self.batch_size):
+            if self.stop_requested:
+                return
+            batch = entries[start:start + self.batch_size]
+            if mask:
+                batch = [entry for entry in batch if mask.match(entry.name)]
+
+            times, sizes = [], []
+            for entry in batch:
+                if limiter:
+                    limiter.acquire()
+                try:
+                    creation_time, size = self.get_entry_time(entry, time_source)
+                except PermissionError as e:
+                    self.logger.error(f"Ошибка доступа при обработке файла {entry.path}: {e}")
+                    creation_time, size = float("inf"), 0
+                except FileNotFoundError:
+                    self.logger.warning(f"Файл не найден: {entry.path}")
+                    creation_time, size = float("inf"), 0
+                except Exception as e:
+                    self.logger.error(f"Ошибка при обработке файла {entry.path}: {e}")
+                    creation_time, size = float("inf"), 0
+                else:
+                    if cache is not None:
+                        cache[(entry.name, time_source)] = (creation_time, size)
+                times.append(creation_time)
+                sizes.append(size)
+
+            if pending is not None:
+                pending.append(min((creation_time for creation_time in times if creation_time >= date_ts), default=float("inf")))
+            if self.use_numpy:
+                selected = np.flatnonzero(np.asarray(times, dtype=np.float64) < date_ts)
+            else:
+                selected = [index for index, creation_time in enumerate(times) if creation_time < date_ts]
+            for index in selected:
+                yield (batch[index], sizes[index]) if with_size else batch[index]
 
-        try:
-            for root, dirs, files in os.walk(path, topdown=False):
-                if self.is_forced_exit:
-                    return
 
-                if time_checker.is_time_up():
-                    self.logger.warning(f"Цикл {path} работает дольше {self.cycle_time_limit_sec} сек. — пропускаем.")
-                    break
+    def start_mr_clean(self):
+        """
+        Метод является основной точкой входа для запуска процесса очистки.
+        Он перебирает все секции файла values.ini, применяет соответствующие методы очистки и логирует результаты.
+        """
+        self.logger.info(f"{self.PROGRAM_NAME} v{self.PROGRAM_VERSION}")
+        self.logger.debug(f"Основной метод для запуска очистки.")
 
-                if not os.access(root, os.R_OK | os.W_OK):  # Проверяем доступ к текущей директории
-                    self.logger.error(f"Недостаточно прав для чтения/записи в директории: {root} — пропускаем.")
-                    continue
+        methods = ["Методы:",
+            "0 - удаляет файлы и каталоги с вложенными файлами.",
+            "1 - удаляет только каталоги с вложенными файлами.",
+            "2 - удаляет только файлы по указанному пути.",
+            "3 - удаляет только файлы в подкаталогах, но не сами подкаталоги.",
+            "4 - удаляет все файлы в каталоге и в подкаталогах, с сохранением структуры каталогов.",
+            "Начало очистки"]
+        for method in methods:
+            self.logger.info(method)
 
-                for file_name in files:  # Обработка файлов
-                    if self.is_forced_exit:
-                        return
-                    
-                    file_path = os.path.join(root, file_name)
+        if self.daemon:
+            self.run_daemon()
+            return
 
-                    # Проверяем существование файла и права доступа
-                    if not os.path.exists(file_path) or not os.access(file_path, os.R_OK | os.W_OK):
-                        self.logger.warning(f"Файл {file_path} не существует или недоступен — пропускаем.")
-                        continue
+        self.clean_logs_folder()
+        self.run_rules(self.rule_table)
+        if self.is_forced_exit:  # Проверяем флаг остановки
+            return
+        if self.quarantine:  # Без резидентного режима элементы с истёкшим льготным периодом удаляются перед выходом
+            self.quarantine.purge(lambda: self.is_forced_exit)
 
-                    try:
-                        creation_date = datetime.datetime.fromtimestamp(self.get_creation_time(file_path))
-                        if creation_date < date:
-                            self.safe_remove(file_path)
-                    except PermissionError as e:
-                        self.logger.error(f"Ошибка доступа при обработке: {file_path}. {e}")
-                    except FileNotFoundError:
-                        self.logger.warning(f"Файл не найден: {file_path}")
-                    except Exception as e:
-                        self.logger.error(f"Ошибка при обработке файла {file_path}: {e}")
-
-                for dir_name in dirs:  # Обработка каталогов
-                    if self.is_forced_exit:
-                        return
-                    
-                    dir_path = os.path.join(root, dir_name)
-
-                    # Проверяем существование каталога и права доступа
-                    if not os.path.exists(dir_path) or not os.access(dir_path, os.R_OK | os.W_OK):
-                        self.logger.warning(f"Каталог {dir_path} не существует или недоступен — пропускаем.")
-                        continue
+        # Автоматическое завершение программы после завершения очистки
+        self.tray_stop_mr_clean(self.icon, exit_source="auto")
 
-                    try:
-                        creation_date = datetime.datetime.fromtimestamp(self.get_creation_time(dir_path))
-                        if creation_date < date:
-                            self.safe_remove(dir_path, is_dir=True)
-                    except PermissionError as e:
-                        self.logger.error(f"Ошибка доступа при обработке: {dir_path}. {e}")
-                    except Exception as e:
-                        self.logger.error(f"Ошибка при обработке каталога {dir_path}: {e}")
-
-            # Проверяем сам корневой каталог после обработки его содержимого
-            if os.path.exists(path) and os.access(path, os.R_OK | os.W_OK):
-                creation_date = datetime.datetime.fromtimestamp(self.get_creation_time(path))
-                if creation_date < date:
-                    self.safe_remove(path, is_dir=True)
 
-        except Exception as e:
-            self.logger.error(f"Ошибка при обработке пути {path}: {e}")
+    def run_rules(self, rule_table):
+        """
+        Метод выполняет правила таблицы: секции с вложенными каталогами объединяются в один обход.
+        """
+        self.is_cancelled = False
+        self.metrics["runs"] += 1
+        self.metrics["last_run_started"] = datetime.datetime.now().isoformat(timespec="seconds")
+        stats_key = "|".join(sorted(rule.section for rule in rule_table))
+        self.progress = progress = RunProgress(self.run_stats.get(stats_key))
+        self.report = report = SpaceReport(self.report_top) if self.report_top > 0 else None
+        reporter = ProgressReporter(self, progress, self.progress_interval)
+        reporter.start()
+        try:
+            for rules in rule_table.groups():
+                if self.stop_requested:  # Проверяем флаг остановки
+                    return
+                self.current_sections = [rule.section for rule in rules]
+                progress.section = rules[0].section
+                self.run_rule_group(rules)
         finally:
-            time_checker.stop_event.set()
-            time_checker.join()
+            reporter.stop()
+            if self.journal:
+                self.journal.sync()
+            self.current_sections = None
+            self.metrics["last_run_duration"] = round(time.monotonic() - progress.started, 3)
+            for name in RunProgress.COUNTERS:
+                self.metrics[name] += getattr(progress, name)
+            if not self.stop_requested:  # Прерванный запуск не используется для оценки следующего
+                self.run_stats[stats_key] = progress.entries
+                self.save_run_stats()
+            if self.hash_cache:
+                self.hash_cache.save()
+            progress.section = None
+            self.logger.info(
+                f"Итоги запуска: проверено каталогов: {progress.dirs_scanned}, файлов: {progress.files_scanned};"
+                f" удалено файлов: {progress.files_removed}, каталогов: {progress.dirs_removed}, в карантин: {progress.quarantined};"
+                f" освобождено: {format_size(progress.bytes_freed)}; ошибок: {progress.errors};"
+                f" время: {format_duration(time.monotonic() - progress.started)}."
+            )
+            for line in report.format() if report else ():
+                self.logger.info(line)
+            self.show_progress(f"Очистка завершена. {progress.format()}")
 
 
-    def delete_only_folders(self, path, date):  # Метод 1
+    def run_daemon(self):
         """
-        Удаляет только каталоги с вложенными файлами, если они старше указанного количества дней.
+        Резидентный режим: каждая секция выполняется по своему расписанию (Schedule, по умолчанию daemon-interval).
+        Скомпилированные правила, маски и индекс каталогов сохраняются между запусками, файлы конфигурации
+        перечитываются только при изменении времени их модификации. Цикл завершается по флагу is_forced_exit.
         """
-        time_checker = TimeChecker(self.cycle_time_limit_sec)
-        time_checker.start()
+        self.logger.info(f"Резидентный режим: секции выполняются по расписанию (по умолчанию каждые {format_duration(self.daemon_interval)}).")
+        while not self.is_forced_exit:
+            self.wake_event.clear()
+            self.reload_config()
+            # Неизменённые при перечитывании правила сохраняют время следующего запуска
+            self.next_runs = next_runs = {rule: self.next_runs[rule] for rule in self.rule_table if rule in self.next_runs}
+
+            now = time.time()
+            requested, self.run_requests = self.run_requests, set()
+            for rule in self.rule_table:
+                if rule not in next_runs:  # Новое правило: интервал запускается сразу, cron - в ближайшее время по выражению
+                    next_runs[rule] = self.get_next_run(rule, now) if isinstance(rule.schedule, CronSchedule) else now
+            due = [rule for rule in self.rule_table if next_runs[rule] <= now or None in requested or rule.section in requested]
+            if due:
+                self.clean_logs_folder()
+                self.run_rules(RuleTable(due))
+                if self.is_forced_exit:
+                    break
+                finished = time.time()
+                for rule in due:
+                    next_runs[rule] = self.get_next_run(rule, finished)
+                next_run = min(next_runs.values())
+                if next_run < float("inf"):
+                    self.logger.info(f"Следующий запуск: {datetime.datetime.fromtimestamp(next_run).strftime('%Y-%m-%d %H:%M:%S')}.")
+
+            timeout = min(next_runs.values(), default=now + self.CONFIG_CHECK_INTERVAL) - time.time()
+            self.wake_event.wait(max(0, min(timeout, self.CONFIG_CHECK_INTERVAL)))
+
+
+    def get_schedule(self, rule):
+        """
+        Расписание правила: Schedule секции или общий интервал daemon-interval.
+        """
+        return rule.schedule or IntervalSchedule(self.daemon_interval)
+
+
+    def get_next_run(self, rule, after):
+        """
+        Время следующего запуска правила после after. Ошибка расписания записывается в лог и снимает секцию
+        с расписания (до перечитывания конфигурации), не останавливая остальные секции.
+        """
+        try:
+            return self.get_schedule(rule).next_run(after)
+        except (ValueError, OverflowError) as e:
+            self.logger.error(f"[{rule.section}] Ошибка расписания: {e} — секция не выполняется по расписанию.")
+            return float("inf")
+
+
+    def request_run(self, sections=None):
+        """
+        Запрос внеочередного запуска в резидентном режиме: указанных секций или всех секций (sections = None).
+        """
+        self.run_requests.update(sections or [None])
+        self.wake_event.set()
+
+
+    def run_rule_group(self, rules):
+        """
+        Метод применяет группу скомпилированных правил (секций values.ini) с вложенными или совпадающими каталогами
+        за один обход (CleanupTraversal). Первым в группе идёт правило корневого каталога.
+        """
+        self.logger.info("~ ~ ~ ~ ~ ~ ~ ~ ~ ~")
+        root = rules[0]
+        if not os.path.exists(root.path):
+            self.logger.warning(f"Каталог {root.path} не найден.")
+            return
+
+        for rule in rules:
+            self.logger.info(
+                f"Сканируется каталог: {rule.path}." +
+                f" Метод: {rule.method}." +
+                f" Период хранения: {rule.days} {get_days_ending(rule.days)} (время: {rule.time_source})." +
+                f" Маска: {", ".join(rule.mask_patterns)}."
+            )
+        if len(rules) > 1:
+            self.logger.info(f"Секции {', '.join(rule.section for rule in rules)} обрабатываются за один обход каталога {root.path}.")
+
+        try:
+            CleanupTraversal(self, rules).run()
+        except Exception as e:
+            self.logger.error(f"Ошибка при обработке секции {root.section}: {e}")
+
+
+    def create_default_configs(self):
+        """
+        Метод создаёт файлы конфигурации config.cfg и values.ini с параметрами по умолчанию, если они отсутствуют в рабочей директории.
+        """
+        # Определение базовой директории
+        if hasattr(sys, "_MEIPASS"):
+            # Если программа запущена как .exe (PyInstaller)
+            base_path = Path(sys._MEIPASS)  # Путь к временной директории
+            output_dir = Path(os.path.dirname(sys.executable))  # Директория, где находится .exe
+        else:
+            # Если программа запущена как скрипт
+            base_path = Path(os.path.abspath("."))
+            output_dir = base_path
+
+        # Путь к config.cfg
+        config_file_path = output_dir / "config.cfg"
+        if not config_file_path.exists():
+            self.logger.info(f"Файл config.cfg не найден. Создание файла с параметрами по умолчанию.")
+            default_config_content = """\
+[SETTINGS]
+# Максимальное время (в секундах), которое программа может тратить на обработку одного каталога или подкаталога.
+cycle-time-limit-sec = 180
+# Количество потоков для параллельного удаления каталогов (методы 0 и 1).
+remove-workers = 4
+# Количество файлов в одном пакете при оценке возраста файлов каталога.
+batch-size = 4096
+# Использование NumPy (если установлен) для векторной оценки пакетов файлов.
+numpy = True
+# Резидентный режим (True): программа не завершается и выполняет секции по расписанию.
+daemon = False
+# Интервал запуска секций без параметра Schedule в резидентном режиме (h - часы, d - дни, w - недели).
+daemon-interval = 1d
+# Работа без окна и иконки в трее (True), журнал выводится только в консоль и файл.
+headless = False
+# Путь к Unix-сокету сервера управления (пусто - сервер отключён).
+control-socket =
+# Интервал обновления хода очистки в окне и подсказке иконки в трее (в секундах).
+progress-interval = 1
+# Карантин (True): элементы перемещаются в каталог карантина и удаляются в фоне после льготного периода.
+quarantine = False
+# Имя каталога карантина, создаваемого на каждой файловой системе.
+quarantine-dir = .mr_clean_quarantine
+# Льготный период, в течение которого элемент можно восстановить из карантина (h - часы, d - дни, w - недели).
+quarantine-grace = 0
+# Лимит операций с диском (удалений и запросов метаданных) в секунду для всех секций (0 - без ограничения).
+ops-per-sec = 0
+# Лимит удаляемых данных в секунду для всех секций (суффиксы K, M, G, T; 0 - без ограничения).
+bytes-per-sec = 0
+# Адаптивное ограничение нагрузки (True): скорость удаления и количество потоков следуют за давлением ввода-вывода (Linux PSI).
+adaptive-throttle = False
+# Давление ввода-вывода (в процентах), выше которого скорость снижается.
+io-pressure-high = 20
+# Давление ввода-вывода (в процентах), ниже которого скорость растёт.
+io-pressure-low = 5
+# Журнал удалений (True): каждое удаление по правилам values.ini записывается в файл journal-file.
+journal = False
+# Файл журнала удалений (JSON Lines, путь относительно каталога программы).
+journal-file = deletions.jsonl
+# Максимальный интервал сброса журнала на диск (в секундах).
+journal-fsync-interval = 1
+# Количество каталогов и расширений в отчёте о занятом месте в конце запуска (0 - отчёт отключён).
+report-top = 10
+# Количество потоков сжатия архивов для секций с параметром Archive.
+archive-workers = 2
+# Каталог временных файлов очереди кандидатов TargetFreePercent/TargetFreeBytes (пусто - системный каталог временных файлов).
+spill-dir =
+
+[LOG]
+# Включение (True) или отключение (False) логирования.
+logging = True
+# Уровень детализации логов. Доступные значения: DEBUG, INFO, WARNING, ERROR, CRITICAL
+log-level = INFO
+# Все логи старше указанного количества дней будут автоматически удалены.
+log-days-limit = 7
+"""
+            with open(config_file_path, "w", encoding="utf-8") as config_file:
+                config_file.write(default_config_content)
+
+        # Путь к values.ini
+        values_file_path = output_dir / "values.ini"
+        if not values_file_path.exists():
+            self.logger.info(f"Файл values.ini не найден. Создание файла с параметрами по умолчанию.")
+            default_values_content = """\
+# Методы:
+# 0 - удаляет файлы и каталоги с вложенными файлами.
+# 1 - удаляет только каталоги с вложенными файлами.
+# 2 - удаляет только файлы по указанному пути.
+# 3 - удаляет только файлы в подкаталогах, но не сами подкаталоги.
+# 4 - удаляет все файлы в каталоге и в подкаталогах, с сохранением структуры каталогов.
+
+# Произвольное имя секции
+[Folder Logs]
+# Путь к очищаемому каталогу
+Path = "C:\\Logs"
+# Метод удаления
+Method = 2
+# Количество дней, за которые нужно оставить каталоги и файлы и не удалять их
+Days = 7
+# Удаление файлов на основе масок имён и расширений
+Mask = *.log
+
+[Folder_Temp]
+Path = %%TEMP%%
+Method = 4
+Days = 30
+Mask = *.tmp, *.log
+"""
+            with open(values_file_path, "w", encoding="utf-8") as values_file:
+                values_file.write(default_values_content)
+
+        # Добавляем задержку для завершения записи файлов
+        time.sleep(1)  # Задержка в 1 секунду
+
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    Скомпилированное правило очистки - одна секция values.ini.
+    Все значения разбираются и проверяются один раз при загрузке конфигурации, объект неизменяемый.
+    """
+    section: str
+    path: str  # Путь с раскрытыми переменными среды
+    key: str  # Нормализованный путь для сравнения и поиска в дереве префиксов
+    method: str
+    days: int
+    mask_patterns: tuple = ("*.*",)
+    time_source: str = "birth"
+    target_free_percent: float = None
+    target_free_bytes: int = None
+    max_size: int = None
+    keep_last: int = None
+    group_pattern: re.Pattern = None
+    retention: tuple = None
+    exclude: tuple = ()  # Шаблоны имён элементов, которые правило никогда не удаляет
+    prune: tuple = ()  # Шаблоны имён каталогов, в которые правило не спускается
+    one_file_system: bool = False  # Не переходить на другие файловые системы (точки монтирования)
+    symlinks: str = "remove"  # Политика для символических ссылок и точек соединения
+    remove_empty: bool = False  # Удалять каталоги, которые опустели после удаления файлов (или пустые и старше Days)
+    schedule: object = None  # Расписание для резидентного режима (IntervalSchedule/CronSchedule), None - общий интервал
+    duplicates: str = None  # Режим удаления дубликатов: какая копия сохраняется (DUPLICATE_POLICIES)
+    archive: str = None  # Каталог архивов: устаревшие файлы архивируются перед удалением
+    archive_format: str = "gz"
+    archive_max_size: int = 1024 ** 3  # Объём исходных данных, после которого начинается новый архив
+    ops_per_sec: float = None  # Лимит операций (удалений и запросов метаданных) в секунду
+    bytes_per_sec: int = None  # Лимит удаляемых байт в секунду
+    # Маски, скомпилированные в from_section: сопоставление имён при обходе не проходит через кэш регулярных выражений
+    file_regex: re.Pattern = field(default=None, compare=False, repr=False)
+    exclude_regex: re.Pattern = field(default=None, compare=False, repr=False)
+    prune_regex: re.Pattern = field(default=None, compare=False, repr=False)
+    path_matcher: PathMask = field(default=None, compare=False, repr=False)
+
+    @property
+    def mode(self):
+        """
+        Режим отбора элементов: target, quota, keep-last, retention, duplicates или age (обычное удаление по Days).
+        """
+        if self.target_free_percent is not None or self.target_free_bytes is not None:
+            return "target"
+        if self.max_size is not None:
+            return "quota"
+        if self.keep_last is not None:
+            return "keep-last"
+        if self.retention:
+            return "retention"
+        if self.duplicates:
+            return "duplicates"
+        return "age"
+
+
+    @property
+    def file_mask(self):
+        """
+        Маска файлов для обхода: None означает все файлы (метод 0 и маска "*.*" для метода 3).
+        """
+        if self.method == "0" or (self.method == "3" and self.mask_patterns == ("*.*",)):
+            return None
+        return self.mask_patterns
+
+
+    @property
+    def path_mask(self):
+        """
+        Автомат PathMask для правил с файлами по маске (методы 2, 3, 4), если хотя бы один шаблон содержит путь; иначе None.
+        """
+        return self.path_matcher
+
+
+    def is_excluded(self, name):
+        """
+        Проверка, исключён ли элемент с указанным именем из удаления (Exclude).
+        """
+        return self.exclude_regex is not None and self.exclude_regex.match(name) is not None
+
+
+    def is_pruned(self, name):
+        """
+        Проверка, исключён ли каталог с указанным именем из обхода (Prune).
+        """
+        return self.prune_regex is not None and self.prune_regex.match(name) is not None
+
+
+    def cutoff_date(self, now=None):
+        """
+        Граница хранения: элементы старше этой даты подлежат удалению.
+        """
+        return (now or datetime.datetime.now()) - datetime.timedelta(days=self.days)
+
+
+    @classmethod
+    def from_section(cls, config, section):
+        """
+        Компиляция секции values.ini в правило. Ошибки значений приводят к ValueError/KeyError.
+        """
+        get = lambda option: config.get(section, option, fallback=None)
+        path = os.path.expandvars(config.get(section, "Path").strip('"'))
+        method = config.get(section, "Method").strip()
+        if method not in METHODS:
+            raise ValueError(f"неизвестный метод {method}. Доступные значения: {', '.join(METHODS)}")
+
+        time_source = (get("TimeSource") or "birth").strip('"').lower()
+        if time_source not in TIME_SOURCES:
+            raise ValueError(f"неизвестный источник времени {time_source}. Доступные значения: {', '.join(TIME_SOURCES)}")
+
+        symlinks = (get("Symlinks") or "remove").strip('"').lower()
+        if symlinks not in SYMLINK_POLICIES:
+            raise ValueError(f"неизвестная политика ссылок {symlinks}. Доступные значения: {', '.join(SYMLINK_POLICIES)}")
+
+        split_patterns = lambda value: tuple(pattern.strip() for pattern in (value or "").strip('"').split(",") if pattern.strip())
+        mask_patterns = split_patterns(get("Mask")) or ("*.*",)
+        target_free_percent = config.getfloat(section, "TargetFreePercent", fallback=None)
+        target_free_bytes = parse_size(get("TargetFreeBytes")) if get("TargetFreeBytes") else None
+        max_size = parse_size(get("MaxSize")) if get("MaxSize") else None
+        keep_last = config.getint(section, "KeepLast", fallback=None)
+        group_pattern = re.compile((get("GroupBy") or DEFAULT_GROUP_BY).strip('"')) if keep_last is not None else None
+        retention = tuple(parse_retention(get("Retention"))) if get("Retention") else None
+        duplicates = (get("Duplicates") or "").strip('"').lower() or None
+        if duplicates and duplicates not in DUPLICATE_POLICIES:
+            raise ValueError(f"неизвестная политика дубликатов {duplicates}. Доступные значения: {', '.join(DUPLICATE_POLICIES)}")
+        if duplicates and method == "1":
+            raise ValueError("Duplicates не поддерживается для метода 1")
+        archive = os.path.expandvars(get("Archive").strip('"')) if get("Archive") else None
+        archive_format = (get("ArchiveFormat") or "gz").strip('"').lower()
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"неизвестный формат архива {archive_format}. Доступные значения: {', '.join(ARCHIVE_FORMATS)}")
+
+        # В режимах по объёму, количеству, уровням хранения и дубликатам Days задаёт минимальный возраст и может быть не указан
+        days_optional = any(value is not None for value in (target_free_percent, target_free_bytes, max_size, keep_last, retention, duplicates))
+        days = int(config.get(section, "Days", fallback="0") if days_optional else config.get(section, "Days"))
+        if archive and (days_optional or method not in ("2", "3", "4")):
+            raise ValueError("Archive поддерживается только для удаления файлов по Days (методы 2, 3, 4)")
+
+        rule = cls(
+            section=section, path=path, key=normalize_path(path), method=method, days=days,
+            mask_patterns=mask_patterns, time_source=time_source,
+            target_free_percent=target_free_percent, target_free_bytes=target_free_bytes,
+            max_size=max_size, keep_last=keep_last, group_pattern=group_pattern, retention=retention,
+            exclude=split_patterns(get("Exclude")), prune=split_patterns(get("Prune")),
+            one_file_system=config.getboolean(section, "OneFileSystem", fallback=False), symlinks=symlinks,
+            remove_empty=config.getboolean(section, "RemoveEmptyDirs", fallback=False),
+            schedule=parse_schedule(get("Schedule")) if get("Schedule") else None, duplicates=duplicates,
+            archive=archive, archive_format=archive_format,
+            archive_max_size=parse_size(get("ArchiveMaxSize")) if get("ArchiveMaxSize") else 1024 ** 3,
+            ops_per_sec=config.getfloat(section, "OpsPerSec", fallback=None),
+            bytes_per_sec=parse_size(get("BytesPerSec")) if get("BytesPerSec") else None,
+        )
+        return rule.compiled()
+
+
+    def compiled(self):
+        """
+        Копия правила со скомпилированными масками Mask, Exclude и Prune (и автоматом PathMask для масок с путями).
+        """
+        file_mask = self.file_mask
+        path_matcher = None
+        if self.method in ("2", "3", "4") and file_mask and any("/" in pattern or "\\" in pattern for pattern in file_mask):
+            path_matcher = PathMask(file_mask)
+        return replace(
+            self, file_regex=compile_mask(file_mask) if file_mask else None,
+            exclude_regex=compile_mask(self.exclude) if self.exclude else None,
+            prune_regex=compile_mask(self.prune) if self.prune else None, path_matcher=path_matcher,
+        )
+
+
+
+class PathTrieNode:
+    __slots__ = ("children", "rules")
+
+    def __init__(self):
+        self.children = {}
+        self.rules = ()
+
+
+
+class RuleTable:
+    """
+    Таблица скомпилированных правил с деревом префиксов по компонентам нормализованного пути.
+    Дерево разбивает правила на группы вложенных каталогов (groups) за один проход независимо от количества секций,
+    несколько секций с одним путём хранятся в одном узле в порядке следования в values.ini.
+    """
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.root = PathTrieNode()
+        for rule in self.rules:
+            node = self.root
+            for part in self.split_key(rule.key):
+                node = node.children.setdefault(part, PathTrieNode())
+            node.rules = node.rules + (rule,)
+
+
+    def __iter__(self):
+        return iter(self.rules)
+
+
+    def __len__(self):
+        return len(self.rules)
+
+
+    @staticmethod
+    def split_key(key):
+        return [part for part in key.split(os.sep) if part]
+
+
+    @classmethod
+    def from_config(cls, config, logger=None):
+        """
+        Компиляция всех секций values.ini. Секции с ошибками пропускаются с записью в лог.
+        """
+        rules = []
+        for section in config.sections():
+            try:
+                rules.append(Rule.from_section(config, section))
+            except (ValueError, KeyError, configparser.Error, re.error) as e:
+                if logger:
+                    logger.error(f"Секция {section} пропущена: {e}")
+        return cls(rules)
+
+
+    def groups(self):
+        """
+        Метод возвращает группы правил для совместного обхода: правило верхнего каталога и все правила,
+        каталоги которых вложены в него или совпадают с ним. Внутри группы правила упорядочены по глубине
+        каталога, группы - по первой секции в values.ini.
+        """
+        order = {rule: index for index, rule in enumerate(self.rules)}
+        groups = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if not node.rules:
+                stack.extend(node.children.values())
+                continue
+            group, subtree = [], [node]
+            while subtree:  # Обход в ширину: правила менее глубоких каталогов идут первыми
+                current = subtree.pop(0)
+                group.extend(current.rules)
+                subtree.extend(current.children.values())
+            groups.append(group)
+        return sorted(groups, key=lambda group: min(order[rule] for rule in group))
+
+
+
+class TokenBucket:
+    """
+    Маркерная корзина: маркеры пополняются со скоростью rate в секунду, ёмкость - запас на одну секунду.
+    Операция сразу списывает нужное количество маркеров (корзина может уйти в минус) и ждёт, пока долг не будет погашен,
+    поэтому средняя скорость соблюдается и для запросов больше ёмкости (например, удаления большого файла).
+    """
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.capacity = self.rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def set_rate(self, rate):
+        """
+        Метод меняет скорость пополнения (AdaptiveThrottle), накопленные маркеры и долг сохраняются.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.rate = self.capacity = float(rate)
+            self.tokens = min(self.tokens, self.capacity)
+
+
+    def reserve(self, amount):
+        """
+        Метод списывает amount маркеров и возвращает время ожидания (в секундах), после которого операцию можно выполнить.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+
+class RateLimiter:
+    """
+    Ограничение нагрузки на диск: операций (удалений и запросов метаданных) в секунду и байт удаляемых данных в секунду.
+    Лимит секции (OpsPerSec/BytesPerSec) связан с общим лимитом [SETTINGS] через parent:
+    операция секции расходует оба бюджета. Объект используется из нескольких потоков удаления одновременно.
+    """
+    WAIT_STEP = 0.25  # Шаг ожидания: флаг остановки проверяется не реже этого интервала (в секундах)
+
+    def __init__(self, ops_per_sec=None, bytes_per_sec=None, parent=None, stop_check=None):
+        self.ops = TokenBucket(ops_per_sec) if ops_per_sec else None
+        self.bytes = TokenBucket(bytes_per_sec) if bytes_per_sec else None
+        self.parent = parent
+        self.stop_check = stop_check or (lambda: False)
+        self.used_ops = 0  # Количество операций для оценки фактической скорости (приблизительно, без блокировки)
+
+
+    def reserve(self, ops, size):
+        self.used_ops += ops
+        delay = self.parent.reserve(ops, size) if self.parent else 0
+        # Корзины читаются один раз: AdaptiveThrottle может снять лимит (ops = None) из другого потока
+        ops_bucket, bytes_bucket = self.ops, self.bytes
+        if ops_bucket and ops:
+            delay = max(delay, ops_bucket.reserve(ops))
+        if bytes_bucket and size:
+            delay = max(delay, bytes_bucket.reserve(size))
+        return delay
+
+
+    def acquire(self, ops=1, size=0):
+        """
+        Метод ждёт, пока бюджеты позволят выполнить ops операций над size байтами.
+        Ожидание прерывается при остановке запуска.
+        """
+        delay = self.reserve(ops, size)
+        if delay <= 0:
+            return
+        deadline = time.monotonic() + delay
+        while not self.stop_check():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, self.WAIT_STEP))
+
+
+
+class AdaptiveThrottle(threading.Thread):
+    """
+    Адаптивное ограничение нагрузки: раз в SAMPLE_INTERVAL секунд поток читает давление ввода-вывода (PSI, /proc/pressure/io;
+    full учитывается с двойным весом), а если PSI недоступен - среднюю загрузку системы за минуту в процентах на ядро.
+    При высоком давлении лимит операций в секунду и количество потоков удаления уменьшаются вдвое,
+    при низком - постепенно растут, пока ограничение не будет снято полностью.
+    Ограничитель limiter является родительским для общих лимитов [SETTINGS], поэтому действует на все секции.
+    """
+    SAMPLE_INTERVAL = 2  # Интервал измерения давления (в секундах)
+    DECREASE = 0.5  # Множитель лимита при высоком давлении
+    INCREASE = 1.25  # Множитель лимита при низком давлении
+    MIN_OPS_PER_SEC = 10  # Нижняя граница лимита операций в секунду
+    LOAD_HIGH = 100  # Пороги загрузки системы (в процентах на ядро), если PSI недоступен
+    LOAD_LOW = 50
+
+    def __init__(self, mr_clean, high, low):
+        super().__init__(daemon=True)
+        self.mr_clean = mr_clean
+        self.high = high
+        self.low = low
+        self.limiter = RateLimiter(stop_check=lambda: mr_clean.stop_requested)  # Без лимита, пока давление не выросло
+        self.ceiling = None  # Скорость до первого снижения: выше неё лимит снимается
+        self.workers = None  # Текущее количество потоков удаления (None - значение remove-workers)
+        self.pressure = None
+        self.stop_event = threading.Event()
+
+
+    @staticmethod
+    def available():
+        return read_io_pressure() is not None or hasattr(os, "getloadavg")
+
+
+    def sample(self):
+        """
+        Метод возвращает давление и пороги (давление, высокий, низкий) или None, если измерить давление не удалось.
+        """
+        pressure = read_io_pressure()
+        if pressure is not None:
+            return max(pressure[0], pressure[1] * 2), self.high, self.low
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1) * 100, self.LOAD_HIGH, self.LOAD_LOW
+        except (AttributeError, OSError):
+            return None
+
+
+    def run(self):
+        last_ops, last_time = self.limiter.used_ops, time.monotonic()
+        while not self.stop_event.wait(self.SAMPLE_INTERVAL) and not self.mr_clean.is_forced_exit:
+            now = time.monotonic()
+            observed = (self.limiter.used_ops - last_ops) / max(now - last_time, 1e-6)
+            last_ops, last_time = self.limiter.used_ops, now
+            sample = self.sample()
+            if sample:
+                self.adjust(observed, *sample)
+
+
+    def adjust(self, observed, pressure, high, low):
+        """
+        Метод изменяет лимит операций и количество потоков удаления по измеренному давлению.
+        observed - фактическая скорость операций за последний интервал.
+        """
+        self.pressure = round(pressure, 1)
+        base_workers = self.mr_clean.remove_workers
+        workers = self.workers or base_workers
+        bucket = self.limiter.ops
+        if pressure >= high:
+            if bucket is None:
+                self.ceiling = max(observed, self.MIN_OPS_PER_SEC)
+                rate = self.ceiling * self.DECREASE
+            else:
+                rate = bucket.rate * self.DECREASE
+            rate = max(rate, self.MIN_OPS_PER_SEC)
+            workers = max(1, workers // 2)
+        elif pressure < low and bucket is not None:
+            rate = bucket.rate * self.INCREASE
+            workers = min(base_workers, workers + 1)
+            if rate >= self.ceiling:
+                self.limiter.ops = None
+                self.workers = None
+                self.mr_clean.tree_remover.workers = base_workers
+                self.mr_clean.logger.info(f"Нагрузка на диск снизилась ({self.pressure}%) — адаптивное ограничение снято.")
+                return
+        else:
+            return
+
+        if bucket is None:
+            self.limiter.ops = TokenBucket(rate)
+        elif rate != bucket.rate:
+            bucket.set_rate(rate)
+        elif workers == self.workers:
+            return
+        self.workers = workers
+        self.mr_clean.tree_remover.workers = workers
+        self.mr_clean.logger.debug(f"Нагрузка на диск {self.pressure}%: лимит {rate:.0f} оп/с, потоков удаления: {workers}.")
+
+
+    def snapshot(self):
+        bucket = self.limiter.ops
+        return {
+            "pressure": self.pressure,
+            "ops_per_sec": round(bucket.rate) if bucket else None,
+            "workers": self.workers or self.mr_clean.remove_workers,
+        }
+
+
+    def stop(self):
+        self.stop_event.set()
+
+
+
+class RemovalResult:
+    """
+    Итог рекурсивного удаления: количество удалённых элементов, освобождённые байты и собранные ошибки.
+    """
+    def __init__(self):
+        self.entries = 0
+        self.bytes = 0
+        self.errors = []  # Список пар (путь, исключение)
+        self.lock = threading.Lock()
+
+
+    def add(self, entries, size):
+        with self.lock:
+            self.entries += entries
+            self.bytes += size
+
+
+    def add_error(self, path, error):
+        with self.lock:
+            self.errors.append((path, error))
+
+
+
+class TreeRemover:
+    # Удаление через дескрипторы каталогов доступно на Linux/macOS; на Windows используются пути
+    USE_DIR_FD = (
+        os.scandir in os.supports_fd
+        and os.open in os.supports_dir_fd
+        and os.unlink in os.supports_dir_fd
+        and os.rmdir in os.supports_dir_fd
+    )
+    OPEN_DIR_FLAGS = os.O_RDONLY | getattr(os, "O_DIRECTORY", 0) | getattr(os, "O_NOFOLLOW", 0) | getattr(os, "O_CLOEXEC", 0)
+    SPLIT_MAX_DEPTH = 3  # Максимальная глубина, на которую дерево разбивается на параллельные задачи
+    RESCAN_ATTEMPTS = 2  # Сколько раз читать каталог, если после удаления содержимого в нём остались элементы
+
+    def __init__(self, workers=4, stop_check=None):
+        self.workers = max(1, int(workers))
+        self.stop_check = stop_check or (lambda: False)
+
+
+    def remove(self, path, limiter=None):
+        """
+        Метод рекурсивно удаляет каталог и возвращает RemovalResult.
+        Верхние уровни дерева разбиваются на поддеревья, которые удаляются параллельно в пуле потоков.
+        Ошибки отдельных элементов собираются, а удаление продолжается.
+        Ошибки доступа к самому корневому каталогу пробрасываются вызывающему коду.
+        limiter - ограничитель скорости (RateLimiter), общий для всех потоков: каждое удаление файла или каталога
+        расходует одну операцию и размер файла.
+        """
+        result = RemovalResult()
+        path = os.fspath(path)
+        if os.path.islink(path):  # Символическую ссылку на каталог удаляем как файл, не заходя внутрь
+            if limiter:
+                limiter.acquire()
+            os.unlink(path)
+            result.add(1, 0)
+            return result
+
+        # Разбиваем дерево в ширину, пока не наберём достаточно поддеревьев для всех потоков.
+        # Каталоги разбиения открываются через дескрипторы (там, где это поддерживается), как и поддеревья:
+        # элемент уровня - (дескриптор родителя, имя, путь, дескриптор каталога)
+        root_fd = os.open(path, self.OPEN_DIR_FLAGS) if self.USE_DIR_FD else None
+        levels = [[(None, path, path, root_fd)]]
+        opened = [root_fd] if root_fd is not None else []
+        subtrees = []
+        try:
+            while levels[-1] and len(levels) <= self.SPLIT_MAX_DEPTH and not self.stop_check():
+                next_level = []
+                for _, _, dir_path, dir_fd in levels[-1]:
+                    try:
+                        next_level.extend(self._remove_files(dir_fd, dir_path, result, limiter))
+                    except OSError as e:
+                        if dir_path == path:
+                            raise
+                        result.add_error(dir_path, e)
+                if len(next_level) >= self.workers * 4 or len(levels) == self.SPLIT_MAX_DEPTH:
+                    subtrees = next_level
+                    break
+                level = []
+                for parent_fd, name, dir_path in next_level:
+                    dir_fd = self._open_dir(parent_fd, name, dir_path, result) if self.USE_DIR_FD else None
+                    if self.USE_DIR_FD and dir_fd is None:
+                        continue
+                    if dir_fd is not None:
+                        opened.append(dir_fd)
+                    level.append((parent_fd, name, dir_path, dir_fd))
+                levels.append(level)
+
+            if subtrees and not self.stop_check():
+                if self.workers == 1 or len(subtrees) == 1:
+                    for subtree in subtrees:
+                        self._remove_subtree(*subtree, result, limiter)
+                else:
+                    with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                        list(executor.map(lambda subtree: self._remove_subtree(*subtree, result, limiter), subtrees))
+
+            # Удаляем опустевшие каталоги разбиения снизу вверх
+            for level in reversed(levels):
+                for parent_fd, name, dir_path, _ in level:
+                    if self.stop_check():
+                        return result
+                    if limiter:
+                        limiter.acquire()
+                    try:
+                        if parent_fd is None:
+                            os.rmdir(dir_path)
+                        else:
+                            os.rmdir(name, dir_fd=parent_fd)
+                        result.add(1, 0)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        if self._should_rescan(e, 0):  # Каталог пополнился во время удаления - удаляем его заново
+                            self._remove_subtree(parent_fd, name, dir_path, result, limiter)
+                        else:
+                            result.add_error(dir_path, e)
+        finally:
+            for dir_fd in opened:
+                os.close(dir_fd)
+        return result
+
+
+    def _open_dir(self, parent_fd, name, dir_path, result):
+        """
+        Метод открывает каталог name относительно дескриптора parent_fd без перехода по символическим ссылкам.
+        Возвращает дескриптор или None, если каталог уже удалён или не открывается (ошибка учитывается в result).
+        """
+        try:
+            return os.open(name, self.OPEN_DIR_FLAGS, dir_fd=parent_fd)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            result.add_error(dir_path, e)
+            return None
+
+
+    def _remove_files(self, dir_fd, dir_path, result, limiter=None):
+        """
+        Метод удаляет все файлы каталога и возвращает его подкаталоги: [(dir_fd, имя, путь)].
+        Если dir_fd задан, каталог читается и файлы удаляются относительно дескриптора, иначе по пути.
+        Элементы удаляются по мере чтения каталога, без построения полного списка.
+        """
+        subdirs = []
+        with os.scandir(dir_path if dir_fd is None else dir_fd) as entries:
+            for entry in entries:
+                if self.stop_check():
+                    break
+                entry_path = os.path.join(dir_path, entry.name)
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    subdirs.append((dir_fd, entry.name, entry_path))
+                elif dir_fd is None:
+                    self._unlink(entry, entry_path, None, result, limiter=limiter)
+                else:
+                    self._unlink(entry, entry.name, dir_fd, result, entry_path, limiter)
+        return subdirs
+
+
+    def _remove_subtree(self, parent_fd, name, dir_path, result, limiter=None):
+        """
+        Метод удаляет поддерево целиком в текущем потоке.
+        """
+        if self.stop_check():
+            return
+        if self.USE_DIR_FD:
+            self._remove_by_fd(parent_fd, name, dir_path, result, limiter)
+        else:
+            self._remove_by_path(dir_path, result, limiter)
+
+
+    @classmethod
+    def _should_rescan(cls, error, attempt):
+        """
+        Каталог не удалён, потому что не пуст: во время чтения в нём появились элементы
+        или файловая система пропустила часть элементов при удалении во время чтения. Каталог читается ещё раз.
+        """
+        return error.errno in (errno.ENOTEMPTY, errno.EEXIST) and attempt + 1 < cls.RESCAN_ATTEMPTS
+
+
+    def _remove_by_fd(self, parent_fd, name, dir_path, result, limiter=None):
+        """
+        Метод удаляет каталог name относительно дескриптора parent_fd.
+        Дескрипторы исключают повторный разбор полного пути и подмену каталогов символическими ссылками.
+        Дерево обходится без рекурсии, через явный стек: глубина ограничена только числом дескрипторов
+        (открыт один каталог на уровень, как у shutil.rmtree).
+        """
+        stack = []  # Кадры [дескриптор родителя, имя, путь, дескриптор каталога, подкаталоги, попытка]
+        try:
+            self._push_fd_frame(stack, parent_fd, name, dir_path, 0, result, limiter)
+            while stack:
+                if self.stop_check():
+                    return
+                frame = stack[-1]
+                if frame[4]:
+                    _, child_name, child_path = frame[4].pop()
+                    self._push_fd_frame(stack, frame[3], child_name, child_path, 0, result, limiter)
+                    continue
+                stack.pop()
+                parent_fd, name, dir_path, dir_fd, _, attempt = frame
+                os.close(dir_fd)
+                if limiter:
+                    limiter.acquire()
+                try:
+                    os.rmdir(name, dir_fd=parent_fd)
+                    result.add(1, 0)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    if self._should_rescan(e, attempt):
+                        self._push_fd_frame(stack, parent_fd, name, dir_path, attempt + 1, result, limiter)
+                    else:
+                        result.add_error(dir_path, e)
+        finally:
+            for frame in stack:
+                os.close(frame[3])
+
+
+    def _push_fd_frame(self, stack, parent_fd, name, dir_path, attempt, result, limiter):
+        """
+        Метод открывает каталог, удаляет его файлы и кладёт кадр с оставшимися подкаталогами на стек.
+        """
+        dir_fd = self._open_dir(parent_fd, name, dir_path, result)
+        if dir_fd is None:
+            return
+        frame = [parent_fd, name, dir_path, dir_fd, [], attempt]
+        stack.append(frame)  # Дескриптор на стеке закрывается и при ошибках
+        try:
+            frame[4] = self._remove_files(dir_fd, dir_path, result, limiter)
+        except OSError as e:
+            result.add_error(dir_path, e)
+
+
+    def _remove_by_path(self, dir_path, result, limiter=None):
+        """
+        Метод удаляет каталог по пути (для платформ без поддержки дескрипторов каталогов).
+        Дерево обходится без рекурсии, через явный стек.
+        """
+        stack = [[dir_path, None, 0]]  # Кадры [путь, подкаталоги (None - каталог ещё не прочитан), попытка]
+        while stack:
+            if self.stop_check():
+                return
+            frame = stack[-1]
+            dir_path, subdirs, attempt = frame
+            if subdirs is None:
+                try:
+                    frame[1] = subdirs = self._remove_files(None, dir_path, result, limiter)
+                except FileNotFoundError:
+                    stack.pop()
+                    continue
+                except OSError as e:
+                    result.add_error(dir_path, e)
+                    stack.pop()
+                    continue
+            if subdirs:
+                stack.append([subdirs.pop()[2], None, 0])
+                continue
+            stack.pop()
+            if limiter:
+                limiter.acquire()
+            try:
+                os.rmdir(dir_path)
+                result.add(1, 0)
+            except FileNotFoundError:
+                pass
+            except PermissionError as e:
+                if not self._retry_readonly(os.rmdir, dir_path):
+                    result.add_error(dir_path, e)
+                else:
+                    result.add(1, 0)
+            except OSError as e:
+                if self._should_rescan(e, attempt):
+                    stack.append([dir_path, None, attempt + 1])
+                else:
+                    result.add_error(dir_path, e)
+
+
+    def _unlink(self, entry, target, dir_fd, result, entry_path=None, limiter=None):
+        """
+        Метод удаляет файл (или ссылку) и учитывает его размер.
+        """
+        entry_path = entry_path or entry.path
+        try:
+            size = entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            size = 0
+        if limiter:
+            limiter.acquire(1, size)
+        try:
+            if dir_fd is None:
+                os.unlink(target)
+            else:
+                os.unlink(target, dir_fd=dir_fd)
+            result.add(1, size)
+        except FileNotFoundError:
+            pass
+        except PermissionError as e:
+            # На Windows файлы с атрибутом "только чтение" удаляются после снятия атрибута
+            if dir_fd is None and self._retry_readonly(os.unlink, target):
+                result.add(1, size)
+            else:
+                result.add_error(entry_path, e)
+        except OSError as e:
+            result.add_error(entry_path, e)
+
+
+    @staticmethod
+    def _retry_readonly(func, path):
+        """
+        Метод снимает атрибут "только чтение" и повторяет операцию удаления.
+        """
+        if not IS_WINDOWS:
+            return False
+        try:
+            os.chmod(path, stat.S_IWRITE)
+            func(path)
+            return True
+        except OSError:
+            return False
+
+
+
+class Quarantine:
+    """
+    Карантин: удаляемые элементы переименовываются (os.rename) в каталог карантина на той же файловой системе,
+    что занимает постоянное время даже для больших деревьев каталогов. Фоновый поток QuarantinePurger
+    удаляет их после льготного периода (grace), в течение которого элемент можно восстановить.
+    Каталог карантина создаётся один раз для каждой файловой системы: в её корне (точке монтирования),
+    а если там нет прав на запись - в ближайшем к нему каталоге-предке удаляемого элемента.
+    Рядом с каждым элементом хранится описание <id>.json с исходным путём и временем перемещения.
+    """
+    MANIFEST_SUFFIX = ".json"
+
+    def __init__(self, mr_clean, dir_name, grace_sec, registry_file):
+        self.mr_clean = mr_clean
+        self.dir_name = dir_name
+        self.grace_sec = grace_sec
+        self.registry_file = registry_file  # Список каталогов карантина, чтобы очищать их и после перезапуска
+        self.staging = {}  # st_dev -> каталог карантина (None - на этой файловой системе карантин недоступен)
+        self.known = set(self.load_registry())
+        self.lock = threading.Lock()
+        self.purge_lock = threading.Lock()
+        self.sequence = 0
+
+
+    def load_registry(self):
+        try:
+            with open(self.registry_file, encoding="utf-8") as file:
+                return [path for path in json.load(file) if os.path.isdir(path)]
+        except (OSError, ValueError):
+            return []
+
+
+    def get_staging(self, directory, device):
+        """
+        Метод возвращает каталог карантина для файловой системы device, создавая его при первом обращении.
+        """
+        with self.lock:
+            if device in self.staging:
+                return self.staging[device]
+
+            # Каталоги-предки на той же файловой системе, начиная с корня
+            ancestors = []
+            while True:
+                try:
+                    if os.lstat(directory).st_dev != device:
+                        break
+                except OSError:
+                    break
+                ancestors.append(directory)
+                parent = os.path.dirname(directory)
+                if parent == directory:
+                    break
+                directory = parent
+
+            self.staging[device] = None
+            for ancestor in reversed(ancestors):
+                staging = os.path.join(ancestor, self.dir_name)
+                try:
+                    os.makedirs(staging, exist_ok=True)
+                except OSError:
+                    continue
+                if os.access(staging, os.W_OK):
+                    self.staging[device] = staging
+                    if staging not in self.known:
+                        self.known.add(staging)
+                        self.save_registry()
+                    self.mr_clean.logger.debug(f"Каталог карантина: {staging}")
+                    break
+            return self.staging[device]
+
+
+    def save_registry(self):
+        try:
+            with open(self.registry_file, "w", encoding="utf-8") as file:
+                json.dump(sorted(self.known), file, ensure_ascii=False, indent=2)
+        except OSError as e:
+            self.mr_clean.logger.warning(f"Не удалось сохранить {self.registry_file}: {e}")
+
+
+    def move(self, path, is_dir):
+        """
+        Метод перемещает элемент в карантин. Возвращает False, если карантин недоступен
+        (например, нет прав или элемент находится на другой файловой системе) - тогда элемент удаляется сразу.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            staging = self.get_staging(directory, os.lstat(directory).st_dev)
+        except OSError:
+            return False
+        if not staging:
+            return False
+
+        with self.lock:
+            self.sequence += 1
+            item_id = f"{time.time_ns()}-{self.sequence}"
+        target = os.path.join(staging, item_id)
+        try:
+            os.rename(path, target)
+        except OSError as e:
+            self.mr_clean.logger.debug(f"Не удалось переместить {path} в карантин: {e}")
+            return False
+
+        manifest = {"original": os.path.abspath(path), "quarantined_at": time.time(), "is_dir": is_dir}
+        try:
+            with open(target + self.MANIFEST_SUFFIX, "w", encoding="utf-8") as file:
+                json.dump(manifest, file, ensure_ascii=False)
+        except OSError as e:
+            self.mr_clean.logger.warning(f"Не удалось записать описание элемента карантина {target}: {e}")
+        return True
+
+
+    def items(self):
+        """
+        Метод возвращает элементы карантина: (путь в карантине, описание).
+        """
+        for staging in sorted(self.known):
+            try:
+                names = os.listdir(staging)
+            except OSError:
+                continue
+            for name in names:
+                if not name.endswith(self.MANIFEST_SUFFIX):
+                    continue
+                manifest_path = os.path.join(staging, name)
+                try:
+                    with open(manifest_path, encoding="utf-8") as file:
+                        manifest = json.load(file)
+                except (OSError, ValueError):
+                    continue
+                yield manifest_path[:-len(self.MANIFEST_SUFFIX)], manifest
+
+
+    def purge(self, stop_check=None):
+        """
+        Метод удаляет элементы, льготный период которых истёк. Возвращает RemovalResult.
+        purge_lock берётся на время удаления одного элемента, поэтому восстановление не ждёт окончания всей очистки;
+        под блокировкой проверяется, что описание элемента ещё существует (элемент не восстановлен).
+        """
+        stop_check = stop_check or (lambda: False)
+        result = RemovalResult()
+        remover = TreeRemover(1, stop_check=stop_check)  # Один поток: очистка карантина не должна мешать основной работе
+        now = time.time()
+        for item_path, manifest in list(self.items()):
+            if stop_check():
+                break
+            if manifest.get("quarantined_at", 0) + self.grace_sec > now:
+                continue
+            with self.purge_lock:
+                if not os.path.exists(item_path + self.MANIFEST_SUFFIX):
+                    continue
+                try:
+                    if os.path.isdir(item_path) and not os.path.islink(item_path):
+                        removed = remover.remove(item_path, self.mr_clean.rate_limiter)
+                        result.add(removed.entries, removed.bytes)
+                        for error_path, error in removed.errors:
+                            result.add_error(error_path, error)
+                        if removed.errors:
+                            continue
+                    elif os.path.lexists(item_path):
+                        size = os.lstat(item_path).st_size
+                        if self.mr_clean.rate_limiter:
+                            self.mr_clean.rate_limiter.acquire(1, size)
+                        os.remove(item_path)
+                        result.add(1, size)
+                    os.remove(item_path + self.MANIFEST_SUFFIX)
+                except OSError as e:
+                    result.add_error(item_path, e)
+        for error_path, error in result.errors:
+            self.mr_clean.logger.error(f"Ошибка при очистке карантина {error_path}: {error}")
+        if result.entries:
+            self.mr_clean.logger.info(f"Карантин очищен: удалено элементов: {result.entries}, освобождено: {format_size(result.bytes)}.")
+        return result
+
+
+    def restore(self, original):
+        """
+        Метод возвращает элемент из карантина на исходное место. Возвращает исходный путь восстановленного элемента.
+        Выполняется под purge_lock, чтобы фоновая очистка не удаляла элемент во время восстановления.
+        """
+        original = os.path.abspath(original)
+        with self.purge_lock:
+            for item_path, manifest in self.items():
+                if manifest.get("original") != original or not os.path.lexists(item_path):
+                    continue
+                if os.path.lexists(original):
+                    raise FileExistsError(f"{original} уже существует")
+                os.rename(item_path, original)
+                try:
+                    os.remove(item_path + self.MANIFEST_SUFFIX)
+                except FileNotFoundError:
+                    pass
+                self.mr_clean.logger.info(f"Восстановлен из карантина: {original}")
+                return original
+        raise FileNotFoundError(f"{original} не найден в карантине")
+
+
+
+class QuarantinePurger(threading.Thread):
+    """
+    Фоновая очистка карантина с пониженным приоритетом потока (на Linux - nice 19, от него зависит и приоритет ввода-вывода).
+    """
+    PURGE_INTERVAL = 60  # Как часто проверять истечение льготного периода (в секундах)
+
+    def __init__(self, quarantine, stop_check):
+        super().__init__(daemon=True)
+        self.quarantine = quarantine
+        self.stop_check = stop_check
+        self.stop_event = threading.Event()
+
+
+    def run(self):
+        if IS_LINUX:
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)  # На Linux приоритет задаётся для потока
+            except OSError:
+                pass
+        while not self.stop_event.is_set() and not self.stop_check():
+            self.quarantine.purge(self.stop_check)
+            self.stop_event.wait(self.PURGE_INTERVAL)
+
+
+
+class DeletionJournal:
+    """
+    Журнал удалений: файл JSON Lines, в который только дописываются записи (одна строка - один удалённый элемент):
+    ts - время, path - путь, size - освобождённый объём, section и method - секция и метод, dir - каталог,
+    entries - количество удалённых элементов каталога, partial - каталог удалён частично, quarantine - перемещён в карантин.
+    Записи накапливаются в буфере и сбрасываются на диск с fsync группами: при накоплении SYNC_BATCH записей,
+    в конце каждого запуска и не позже чем через fsync_interval секунд после записи - это проверяется и при следующей записи,
+    и фоновым потоком, поэтому записи не задерживаются в буфере во время долгого обхода без удалений.
+    Строка, оборванная при аварийном завершении, отделяется переводом строки при следующем открытии и пропускается при чтении.
+    """
+    SYNC_BATCH = 1024  # Максимальное количество записей между сбросами на диск
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, path, fsync_interval=1):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "ab", buffering=self.BUFFER_SIZE)
+        if self.file.tell() and not self.ends_with_newline():
+            self.file.write(b"\n")
+        self.pending = 0
+        self.synced = time.monotonic()
+        self.stop_event = threading.Event()
+        self.flusher = threading.Thread(target=self.flush_periodically, daemon=True)
+        self.flusher.start()
+
+
+    def flush_periodically(self):
+        """
+        Фоновый сброс записей, пролежавших в буфере дольше fsync_interval.
+        """
+        interval = max(self.fsync_interval, 0.1)
+        timeout = interval
+        while not self.stop_event.wait(timeout):
+            with self.lock:
+                if self.file.closed:
+                    return
+                due = self.synced + interval - time.monotonic()
+                if self.pending and due <= 0:
+                    try:
+                        self.sync_locked()
+                    except OSError:
+                        pass  # Ошибка повторится и будет обработана при записи или закрытии
+                    due = interval
+                timeout = max(due, 0.01) if self.pending else interval
+
+
+    def ends_with_newline(self):
+        with open(self.path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
+
+
+    def write(self, path, size, rule, is_dir=False, **extra):
+        record = {"ts": round(time.time(), 3), "path": path, "size": size or 0, "section": rule.section, "method": rule.method}
+        if is_dir:
+            record["dir"] = True
+        record.update((key, value) for key, value in extra.items() if value)
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8", "surrogateescape") + b"\n"
+        with self.lock:
+            self.file.write(line)
+            self.pending += 1
+            if self.pending >= self.SYNC_BATCH or time.monotonic() - self.synced >= self.fsync_interval:
+                self.sync_locked()
+
+
+    def sync(self):
+        with self.lock:
+            self.sync_locked()
+
+
+    def sync_locked(self):
+        if not self.pending:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.synced = time.monotonic()
+
+
+    def close(self):
+        self.stop_event.set()
+        with self.lock:
+            self.sync_locked()
+            self.file.close()
+
+
+
+class CandidateStore:
+    """
+    Компактное хранилище кандидатов на удаление для режимов, которые накапливают элементы до конца обхода.
+    Вместо кортежа со строкой полного пути (более 200 байт на элемент) поля хранятся по столбцам в массивах array:
+    время, размер, флаги, номер каталога и конец имени в общем буфере имён (имена в кодировке файловой системы).
+    Путь каталога хранится один раз, элементы ссылаются на него по номеру. Запись занимает около 30 байт
+    плюс длина имени, поэтому 10 млн файлов помещаются в несколько сотен мегабайт.
+    Кортеж (время, размер, путь, каталог ли) создаётся только при чтении записи.
+    """
+    __slots__ = ("dirs", "dir_ids", "dir_index", "names", "name_ends", "times", "sizes", "flags")
+    IS_DIR = 1  # Флаг: элемент - каталог
+
+    def __init__(self):
+        self.clear()
+
+
+    def __len__(self):
+        return len(self.times)
+
+
+    def append(self, timestamp, size, path, is_dir=False):
+        """
+        Метод добавляет запись и возвращает её номер.
+        """
+        directory, name = os.path.split(path)
+        dir_id = self.dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = self.dir_ids[directory] = len(self.dirs)
+            self.dirs.append(directory)
+        self.dir_index.append(dir_id)
+        self.names += os.fsencode(name)
+        self.name_ends.append(len(self.names))
+        self.times.append(timestamp)
+        self.sizes.append(size)
+        self.flags.append(self.IS_DIR if is_dir else 0)
+        return len(self.times) - 1
+
+
+    def path(self, index):
+        start = self.name_ends[index - 1] if index else 0
+        name = os.fsdecode(bytes(self.names[start:self.name_ends[index]]))
+        return os.path.join(self.dirs[self.dir_index[index]], name)
+
+
+    def __getitem__(self, index):
+        return self.times[index], self.sizes[index], self.path(index), bool(self.flags[index] & self.IS_DIR)
+
+
+    def order(self, column="times", use_numpy=False, reverse=False):
+        """
+        Метод возвращает номера записей, упорядоченные по столбцу times или sizes.
+        С NumPy столбец сортируется через argsort без копирования в объекты Python.
+        """
+        values = getattr(self, column)
+        if use_numpy and values:
+            order = np.argsort(np.frombuffer(values, dtype=values.typecode), kind="stable")
+            return order[::-1] if reverse else order
+        return sorted(range(len(values)), key=values.__getitem__, reverse=reverse)
+
+
+    def clear(self):
+        """
+        Метод освобождает все записи (массивы создаются заново, поэтому действующие представления NumPy не мешают).
+        """
+        self.dirs = []
+        self.dir_ids = {}
+        self.dir_index = array.array("I")
+        self.names = bytearray()
+        self.name_ends = array.array("Q")
+        self.times = array.array("d")
+        self.sizes = array.array("q")
+        self.flags = array.array("B")
+
+
+
+class CandidateQueue:
+    """
+    Очередь кандидатов на удаление, упорядоченная по времени (сначала самые старые).
+    В памяти хранится не более memory_limit записей (в компактном CandidateStore): при переполнении записи
+    сортируются и сбрасываются во временный файл в каталоге spill_dir, а при чтении все порции сливаются через heapq.merge.
+    Это ограничивает расход памяти на деревьях с миллионами файлов.
+    Если сбросить порцию не удалось (например, на диске нет места), повторных попыток не делается: в памяти
+    остаются только самые старые записи (не более memory_limit), более новые отбрасываются (spill_error, dropped).
+    """
+    def __init__(self, memory_limit=1000000, use_numpy=False, spill_dir=None):
+        self.memory_limit = memory_limit
+        self.use_numpy = use_numpy
+        self.spill_dir = spill_dir  # None - системный каталог временных файлов
+        self.store = CandidateStore()
+        self.runs = []  # Временные файлы с отсортированными порциями
+        self.count = 0
+        self.spill_error = None  # Ошибка сброса на диск, после которой очередь хранит записи только в памяти
+        self.bound = None  # Время, начиная с которого записи отбрасываются сразу (после отказа от сброса)
+        self.dropped = 0
+
+
+    def __len__(self):
+        return self.count
+
+
+    @property
+    def spilled_runs(self):
+        return len(self.runs)
+
+
+    def push(self, timestamp, size, path, is_dir=False):
+        """
+        Метод добавляет кандидата в очередь.
+        """
+        self.count += 1
+        if self.bound is not None and timestamp >= self.bound:
+            self.dropped += 1
+            return
+        self.store.append(timestamp, size, path, is_dir)
+        if len(self.store) >= self.memory_limit:
+            if self.spill_error is None:
+                self._spill()
+            else:
+                self._trim()
+
+
+    def _sorted(self):
+        """
+        Генератор записей из памяти в порядке возрастания времени.
+        """
+        for index in self.store.order(use_numpy=self.use_numpy):
+            yield self.store[index]
+
+
+    def _spill(self):
+        """
+        Метод сбрасывает отсортированные записи из памяти во временный файл.
+        При ошибке записи очередь переходит к хранению самых старых записей в памяти (_trim).
+        """
+        run = None
+        try:
+            run = tempfile.TemporaryFile(prefix="mr_clean_", dir=self.spill_dir)
+            pickler = pickle.Pickler(run, protocol=pickle.HIGHEST_PROTOCOL)
+            for item in self._sorted():
+                pickler.dump(item)
+                pickler.clear_memo()
+            run.seek(0)
+        except OSError as e:
+            if run:
+                try:
+                    run.close()
+                except OSError:
+                    pass
+            self.spill_error = e
+            self._trim()
+            return
+        self.runs.append(run)
+        self.store.clear()
+
+
+    def _trim(self):
+        """
+        Метод оставляет в памяти самые старые записи (половину memory_limit), остальные отбрасываются.
+        Время последней оставленной записи становится границей: более новые записи не добавляются.
+        """
+        keep = self.memory_limit // 2
+        items = [self.store[index] for index in self.store.order(use_numpy=self.use_numpy)[:keep]]
+        self.dropped += len(self.store) - len(items)
+        self.store.clear()
+        for item in items:
+            self.store.append(*item)
+        if items:
+            self.bound = items[-1][0]
+
+
+    @staticmethod
+    def _read_run(run):
+        unpickler = pickle.Unpickler(run)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                return
+
+
+    def __iter__(self):
+        """
+        Метод возвращает кандидатов в порядке возрастания времени.
+        """
+        if not self.runs:
+            yield from self._sorted()
+            return
+        for run in self.runs:
+            run.seek(0)
+        yield from heapq.merge(self._sorted(), *(self._read_run(run) for run in self.runs), key=lambda item: item[0])
+
+
+    def close(self):
+        """
+        Метод освобождает память и удаляет временные файлы.
+        """
+        self.store.clear()
+        for run in self.runs:
+            try:
+                run.close()
+            except OSError:
+                pass
+        self.runs = []
+
+
+
+class RuleCollector:
+    """
+    Базовый накопитель кандидатов для правил, которые выбирают элементы не только по Days
+    (TargetFreePercent/TargetFreeBytes, MaxSize, KeepLast, Retention).
+    Обход передаёт в add() все элементы из области правила, а finish() после обхода выбирает и удаляет элементы.
+    Кандидаты: подкаталоги первого уровня для метода 1, файлы (с учётом маски) для остальных методов.
+    """
+    NEEDS_SIZE = False  # Требуется ли суммарный размер подкаталогов (метод 1)
+    QUARANTINE = True  # Можно ли перемещать элементы в карантин вместо немедленного удаления
+
+    def __init__(self, mr_clean, rule):
+        self.mr_clean = mr_clean
+        self.logger = mr_clean.logger
+        self.rule = rule
+        self.date_ts = rule.cutoff_date().timestamp()
+        self.removed = 0
+
+
+    def add(self, creation_time, size, path, is_dir):
+        raise NotImplementedError
+
+
+    def finish(self, traversal):
+        pass
+
+
+    def close(self):
+        pass
+
+
+    def remove(self, path, is_dir, size=None):
+        if self.mr_clean.safe_remove(path, is_dir=is_dir, size=None if is_dir else size, quarantine=self.QUARANTINE, rule=self.rule):
+            self.removed += 1
+            return True
+        return False
+
+
+
+class TargetFreeCollector(RuleCollector):
+    """
+    Режим TargetFreePercent / TargetFreeBytes: удаление самых старых элементов, пока свободное место на томе не достигнет цели.
+    Кандидаты собираются в ограниченную по памяти очередь (CandidateQueue), которая при переполнении сбрасывается на диск.
+    Свободное место проверяется через shutil.disk_usage по ходу удаления, удаление прекращается сразу после достижения цели.
+    Карантин не используется: перемещение не освобождает место на диске.
+    """
+    NEEDS_SIZE = True
+    QUARANTINE = False
+
+    def __init__(self, mr_clean, rule):
+        super().__init__(mr_clean, rule)
+        usage = shutil.disk_usage(rule.path)
+        self.target = 0
+        if rule.target_free_percent is not None:
+            self.target = int(usage.total * rule.target_free_percent / 100)
+        if rule.target_free_bytes is not None:
+            self.target = max(self.target, rule.target_free_bytes)
+        self.free = usage.free
+        self.satisfied = self.free >= self.target
+        self.queue = CandidateQueue(use_numpy=mr_clean.use_numpy, spill_dir=mr_clean.spill_dir)
+        self.logger.info(f"[{rule.section}] Свободно: {format_size(self.free)}. Цель: {format_size(self.target)}.")
+        if self.satisfied:
+            self.logger.info(f"[{rule.section}] Цель по свободному месту уже достигнута — удаление не требуется.")
+
+
+    def add(self, creation_time, size, path, is_dir):
+        if not self.satisfied and creation_time < self.date_ts:
+            self.queue.push(creation_time, size, path, is_dir)
+
+
+    def finish(self, traversal):
+        if self.satisfied:
+            return
+        self.logger.debug(f"Найдено кандидатов на удаление: {len(self.queue)}. Сброшено на диск порций: {self.queue.spilled_runs}.")
+        if self.queue.spill_error:
+            self.logger.warning(f"[{self.rule.section}] Не удалось сбросить кандидатов во временный файл: {self.queue.spill_error}. "
+                                f"Обрабатываются самые старые, отброшено: {self.queue.dropped}.")
+        check_interval = self.mr_clean.DISK_USAGE_CHECK_INTERVAL
+        estimated_free = self.free
+        for _, size, item_path, is_dir in self.queue:
+            if traversal.should_stop():
+                return
+            if not self.remove(item_path, is_dir, size):
+                continue
+            estimated_free += size
+
+            # Фактическое свободное место проверяем при достижении оценки и периодически (другие процессы тоже пишут на диск)
+            if estimated_free >= self.target or self.removed % check_interval == 0:
+                estimated_free = self.free = shutil.disk_usage(self.rule.path).free
+                if self.free >= self.target:
+                    self.logger.info(f"[{self.rule.section}] Цель достигнута. Свободно: {format_size(self.free)}. Удалено элементов: {self.removed}.")
+                    return
+
+        self.logger.warning(
+            f"[{self.rule.section}] Цель не достигнута: кандидаты закончились."
+            f" Свободно: {format_size(shutil.disk_usage(self.rule.path).free)}. Удалено элементов: {self.removed}."
+        )
+
+
+    def close(self):
+        self.queue.close()
+
+
+
+class QuotaCollector(RuleCollector):
+    """
+    Режим MaxSize: удаление самых старых элементов, пока суммарный размер элементов каталога не станет меньше MaxSize.
+    Размеры суммируются при обходе, а кандидаты хранятся в CandidateStore и раскладываются по корзинам возраста (гистограмма).
+    Элементы моложе Days учитываются в общем размере, но не удаляются.
+    """
+    NEEDS_SIZE = True
+
+    def __init__(self, mr_clean, rule):
+        super().__init__(mr_clean, rule)
+        self.store = CandidateStore()
+        self.buckets = {}  # Номер корзины -> [размер корзины в байтах, номера кандидатов в store]
+        self.total = 0
+
+
+    def add(self, creation_time, size, path, is_dir):
+        self.total += size
+        if creation_time >= self.date_ts:
+            return
+        key = int(creation_time // self.mr_clean.QUOTA_BUCKET_SEC)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [0, array.array("I")]
+        bucket[0] += size
+        bucket[1].append(self.store.append(creation_time, size, path, is_dir))
+
+
+    def finish(self, traversal):
+        excess = self.total - self.rule.max_size
+        self.logger.info(f"[{self.rule.section}] Размер: {format_size(self.total)}. Лимит: {format_size(self.rule.max_size)}.")
+        if excess <= 0:
+            self.logger.info(f"[{self.rule.section}] Лимит размера не превышен — удаление не требуется.")
+            return
+
+        for _, size, item_path, is_dir in self.iter_victims(excess):
+            if traversal.should_stop():
+                return
+            if self.remove(item_path, is_dir, size):
+                excess -= size
+            if excess <= 0:
+                self.logger.info(f"[{self.rule.section}] Лимит размера соблюдён. Удалено элементов: {self.removed}.")
+                return
+
+        self.logger.warning(f"[{self.rule.section}] Лимит размера не достигнут: кандидаты закончились. Превышение: {format_size(excess)}.")
+
+
+    def iter_victims(self, excess):
+        """
+        Генератор кандидатов в порядке удаления (от старых к новым).
+        С NumPy полностью сортируются только самые старые элементы, покрывающие превышение: они выбираются
+        через argpartition (число элементов оценивается по среднему размеру и удваивается, пока их объёма не хватит).
+        Остальные элементы сортируются, только если из-за ошибок удаления понадобились и они.
+        Без NumPy корзины гистограммы возраста, целиком старше границы, отдаются без сортировки, сортируется только граничная корзина.
+        """
+        store = self.store
+        if self.mr_clean.use_numpy and len(store):
+            self.buckets.clear()
+            times = np.frombuffer(store.times, dtype=np.float64)
+            sizes = np.frombuffer(store.sizes, dtype=np.int64)
+            count = len(times)
+            needed = min(count, int(excess / max(int(sizes.sum()) / count, 1) * 1.25) + 1)
+            while True:
+                head = np.argpartition(times, needed - 1)[:needed] if needed < count else np.arange(count)
+                if needed == count or int(sizes[head].sum()) >= excess:
+                    break
+                needed = min(count, needed * 2)
+            for index in head[np.argsort(times[head], kind="stable")]:  # Элементы, покрывающие превышение
+                yield store[index]
+            if needed < count:  # Запас на случай ошибок удаления
+                rest = np.ones(count, dtype=bool)
+                rest[head] = False
+                rest = np.flatnonzero(rest)
+                for index in rest[np.argsort(times[rest], kind="stable")]:
+                    yield store[index]
+            return
+
+        for key in sorted(self.buckets):
+            bucket_size, indices = self.buckets.pop(key)
+            if bucket_size > excess:  # Граничная корзина: удаляется частично, поэтому сортируем её по возрасту
+                indices = sorted(indices, key=store.times.__getitem__)
+            for index in indices:
+                candidate = store[index]
+                yield candidate
+                excess -= candidate[1]
+
+
+    def close(self):
+        self.buckets.clear()
+        self.store.clear()
+
+
+
+class KeepLastCollector(RuleCollector):
+    """
+    Режим KeepLast: в каждой группе остаются KeepLast самых новых элементов, остальные (старше Days) удаляются.
+    Группа определяется каталогом элемента и ключом из его имени: первой группой захвата
+    регулярного выражения GroupBy (или всем совпадением). Элементы, не подходящие под GroupBy, не удаляются.
+    Группировка потоковая: для каждой группы хранится куча из KeepLast самых новых элементов,
+    а вытесненный из кучи элемент удаляется сразу.
+    """
+    def __init__(self, mr_clean, rule):
+        super().__init__(mr_clean, rule)
+        self.groups = {}  # (каталог, ключ группы) -> куча из KeepLast самых новых элементов
+
+
+    def add(self, creation_time, size, path, is_dir):
+        directory, name = os.path.split(path)
+        match = self.rule.group_pattern.match(name)
+        if not match:
+            return
+        heap = self.groups.setdefault((directory, match.group(1) if match.groups() else match.group(0)), [])
+        item = (creation_time, path, is_dir, size)
+        if len(heap) < self.rule.keep_last:
+            heapq.heappush(heap, item)
+            return
+
+        # Вытесняется самый старый из KeepLast + 1 элементов — он точно не входит в число самых новых
+        evicted_time, evicted_path, evicted_is_dir, evicted_size = heapq.heappushpop(heap, item)
+        if evicted_time < self.date_ts:
+            self.remove(evicted_path, evicted_is_dir, evicted_size)
+
+
+    def finish(self, traversal):
+        self.logger.info(f"[{self.rule.section}] Групп: {len(self.groups)}. Удалено элементов: {self.removed}.")
+
+
+
+class RetentionCollector(RuleCollector):
+    """
+    Режим Retention - многоуровневое хранение (дед-отец-сын): например, все элементы за последние 2 дня,
+    по одному в день за 2 недели и по одному в неделю за 3 месяца. Элементы старше последнего уровня удаляются.
+    Время каждого элемента читается один раз при обходе, затем кандидаты сортируются от новых к старым
+    и проходятся один раз: в каждом периоде уровня сохраняется самый новый элемент, остальные удаляются.
+    Кандидаты хранятся в компактном CandidateStore.
+    """
+    def __init__(self, mr_clean, rule):
+        super().__init__(mr_clean, rule)
+        self.store = CandidateStore()
+
+
+    def add(self, creation_time, size, path, is_dir):
+        self.store.append(creation_time, size, path, is_dir)
+
+
+    def finish(self, traversal):
+        tiers = self.rule.retention
+        now = time.time()
+        kept_buckets = set()  # (номер уровня, ключ периода), в которых уже сохранён элемент
+        kept = 0
+        for index in self.store.order(use_numpy=self.mr_clean.use_numpy, reverse=True):
+            if traversal.should_stop():
+                return
+            creation_time, size, item_path, is_dir = self.store[index]
+            age = now - creation_time
+            tier = next((index for index, (max_age, _) in enumerate(tiers) if age < max_age), None)
+            if tier is not None:
+                period = tiers[tier][1]
+                if period == "all":
+                    kept += 1
+                    continue
+                bucket = (tier, get_retention_bucket(creation_time, period))
+                if bucket not in kept_buckets:
+                    kept_buckets.add(bucket)
+                    kept += 1
+                    continue
+
+            if creation_time < self.date_ts:
+                self.remove(item_path, is_dir, size)
+
+        self.logger.info(f"[{self.rule.section}] Сохранено элементов: {kept}. Удалено элементов: {self.removed}.")
+
+
+    def close(self):
+        self.store.clear()
+
+
+
+class HashCache:
+    """
+    Постоянный кэш хэшей содержимого файлов (hash_cache.json). Ключ - устройство, inode, размер и время изменения (mtime_ns),
+    поэтому изменённый или заменённый файл хэшируется заново. Для каждого файла хранятся частичный и полный хэш.
+    Записи, которые не использовались дольше MAX_AGE секунд, удаляются при сохранении.
+    """
+    MAX_AGE = 30 * 86400
+
+    def __init__(self, path, logger):
+        self.path = path
+        self.logger = logger
+        self.entries = self.load()
+        self.changed = False
+
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Не удалось прочитать {self.path}: {e}")
+            return {}
+
+
+    @staticmethod
+    def make_key(stats):
+        return f"{stats.st_dev}:{stats.st_ino}:{stats.st_size}:{stats.st_mtime_ns}"
+
+
+    def get(self, key, kind):
+        """
+        Метод возвращает хэш вида kind ("partial" или "full") или None. Использованная запись помечается временем.
+        """
+        entry = self.entries.get(key)
+        if not entry or kind not in entry:
+            return None
+        entry["seen"] = int(time.time())
+        self.changed = True
+        return entry[kind]
+
+
+    def put(self, key, kind, digest):
+        entry = self.entries.setdefault(key, {})
+        entry[kind] = digest
+        entry["seen"] = int(time.time())
+        self.changed = True
+
+
+    def save(self):
+        if not self.changed:
+            return
+        expired = time.time() - self.MAX_AGE
+        self.entries = {key: entry for key, entry in self.entries.items() if entry.get("seen", 0) >= expired}
+        try:
+            with open(self.path, "w", encoding="utf-8") as file:
+                json.dump(self.entries, file, separators=(",", ":"))
+            self.changed = False
+        except OSError as e:
+            self.logger.warning(f"Не удалось сохранить {self.path}: {e}")
+
+
+
+class DuplicateCollector(RuleCollector):
+    """
+    Режим Duplicates: из одинаковых по содержимому файлов остаётся одна копия (политика Duplicates),
+    остальные копии старше Days удаляются. Одинаковые файлы ищутся в три этапа, каждый следующий - только
+    для совпавших на предыдущем: размер (известен из обхода), частичный хэш первого и последнего блока,
+    полный хэш содержимого (большие файлы читаются через mmap, остальные - большими блоками).
+    Хэши сохраняются в HashCache, поэтому при следующих запусках читаются только новые и изменённые файлы.
+    Файлы хранятся в компактном CandidateStore и группируются по размеру сортировкой после обхода.
+    Жёсткие ссылки на один и тот же файл не считаются копиями, пустые файлы и символические ссылки не рассматриваются.
+    """
+    PARTIAL_BLOCK = 64 * 1024  # Размер первого и последнего блока для частичного хэша
+    READ_CHUNK = 8 * 1024 * 1024  # Размер блока полного хэша: между блоками проверяется флаг остановки
+    MMAP_MIN_SIZE = 4 * 1024 * 1024  # Файлы начиная с этого размера читаются через mmap
+
+    def __init__(self, mr_clean, rule):
+        super().__init__(mr_clean, rule)
+        self.store = CandidateStore()
+
+
+    def add(self, creation_time, size, path, is_dir):
+        if size:
+            self.store.append(creation_time, size, path)
+
+
+    def finish(self, traversal):
+        cache = self.mr_clean.get_hash_cache()
+        store = self.store
+        groups = duplicates = 0
+        for size, indices in itertools.groupby(store.order("sizes", self.mr_clean.use_numpy), key=store.sizes.__getitem__):
+            indices = list(indices)
+            if len(indices) < 2:
+                continue
+            if traversal.should_stop():
+                break
+            items = [(store.times[index], store.path(index)) for index in indices]
+            for copies in self.find_copies(size, items, cache, traversal):
+                groups += 1
+                duplicates += len(copies) - 1
+                self.remove_copies(copies, size)
+            traversal.time_checker.reset_timer()
+        self.logger.info(f"[{self.rule.section}] Групп дубликатов: {groups}, лишних копий: {duplicates}. Удалено файлов: {self.removed}.")
+
+
+    def close(self):
+        self.store.clear()
+
+
+    def find_copies(self, size, items, cache, traversal):
+        """
+        Метод разбивает файлы одного размера на группы одинаковых по содержимому (из двух и более файлов).
+        """
+        by_inode = {}
+        for creation_time, path in items:
+            try:
+                stats = os.lstat(path)
+            except OSError as e:
+                self.logger.error(f"Ошибка при обработке файла {path}: {e}")
+                continue
+            if stat.S_ISREG(stats.st_mode) and stats.st_size == size:
+                by_inode.setdefault((stats.st_dev, stats.st_ino), []).append((creation_time, path, HashCache.make_key(stats)))
+        # Удаление одной из жёстких ссылок не освобождает места, поэтому такие файлы не рассматриваются
+        files = [links[0] for links in by_inode.values() if len(links) == 1]
+
+        # Для небольших файлов частичный хэш покрывает всё содержимое и полного хэша не требуется
+        kinds = ("partial",) if size <= 2 * self.PARTIAL_BLOCK else ("partial", "full")
+        candidates = [files] if len(files) > 1 else []
+        for kind in kinds:
+            grouped = []
+            for group in candidates:
+                by_digest = {}
+                for item in group:
+                    if traversal.should_stop():
+                        return []
+                    digest = cache.get(item[2], kind)
+                    if digest is None:
+                        try:
+                            digest = self.hash_file(item[1], size, kind == "partial", traversal.should_stop)
+                        except OSError as e:
+                            self.logger.error(f"Ошибка при чтении файла {item[1]}: {e}")
+                            continue
+                        if digest is None:
+                            return []
+                        cache.put(item[2], kind, digest)
+                    by_digest.setdefault(digest, []).append(item)
+                grouped.extend(same for same in by_digest.values() if len(same) > 1)
+            candidates = grouped
+        return candidates
+
+
+    def hash_file(self, path, size, partial, stop_check):
+        """
+        Метод возвращает хэш первого и последнего блока (partial) или всего содержимого файла.
+        None - чтение прервано флагом остановки.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as file:
+            if partial:
+                digest.update(file.read(self.PARTIAL_BLOCK))
+                if size > self.PARTIAL_BLOCK:
+                    file.seek(max(self.PARTIAL_BLOCK, size - self.PARTIAL_BLOCK))
+                    digest.update(file.read(self.PARTIAL_BLOCK))
+                return digest.hexdigest()
+            if size >= self.MMAP_MIN_SIZE:
+                try:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                        for offset in range(0, len(view), self.READ_CHUNK):
+                            if stop_check():
+                                return None
+                            digest.update(view[offset:offset + self.READ_CHUNK])
+                    return digest.hexdigest()
+                except (OSError, ValueError):
+                    digest = hashlib.blake2b(digest_size=16)  # mmap недоступен - читаем блоками
+                    file.seek(0)
+            while chunk := file.read(self.READ_CHUNK):
+                if stop_check():
+                    return None
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+    def remove_copies(self, copies, size):
+        """
+        Метод сохраняет одну копию по политике Duplicates и удаляет остальные копии старше Days.
+        """
+        policy = self.rule.duplicates
+        if policy == "newest":
+            keep = max(copies, key=lambda item: item[0])
+        elif policy == "shortest-path":
+            keep = min(copies, key=lambda item: (len(item[1]), item[0]))
+        else:
+            keep = min(copies, key=lambda item: item[0])
+        for creation_time, path, _ in copies:
+            if path != keep[1] and creation_time < self.date_ts:
+                self.logger.debug(f"[{self.rule.section}] {path} - копия {keep[1]}")
+                self.remove(path, False, size)
+
+
+
+COLLECTORS = {
+    "target": TargetFreeCollector,
+    "quota": QuotaCollector,
+    "keep-last": KeepLastCollector,
+    "retention": RetentionCollector,
+    "duplicates": DuplicateCollector,
+}
+
+
+
+class ArchiveWriter:
+    """
+    Один архив tar (gz, xz или zst), который записывается потоково в файл <имя>.part.
+    Хэш каждого файла считается при том же чтении, которым файл записывается в архив, а verify() читает архив заново
+    и сравнивает размеры и хэши всех элементов. После успешной проверки файл переименовывается в окончательное имя.
+    """
+    class HashingReader:
+        def __init__(self, file, digest):
+            self.file = file
+            self.digest = digest
+
+        def read(self, size=-1):
+            data = self.file.read(size)
+            self.digest.update(data)
+            return data
+
+
+    def __init__(self, path, compression):
+        self.path = path
+        self.part_path = path + ".part"
+        self.compression = compression
+        self.members = []  # (исходный путь, имя в архиве, размер, время изменения, хэш)
+        self.source_bytes = 0
+        self.error = None  # Ошибка записи: архив не используется, исходные файлы не удаляются
+        self.file = open(self.part_path, "wb")
+        self.stream = zstandard.ZstdCompressor().stream_writer(self.file, closefd=False) if compression == "zst" else None
+        self.tar = tarfile.open(fileobj=self.stream, mode="w|") if self.stream else tarfile.open(fileobj=self.file, mode=f"w|{compression}")
+
+
+    def add(self, path, arcname):
+        try:
+            tarinfo = self.tar.gettarinfo(path, arcname)
+            if not tarinfo.isreg():  # Ссылки и специальные файлы не архивируются и не удаляются
+                return
+            digest = hashlib.blake2b(digest_size=16)
+            with open(path, "rb") as source:
+                self.tar.addfile(tarinfo, self.HashingReader(source, digest))
+        except (OSError, tarfile.TarError) as e:
+            self.error = f"{path}: {e}"
+            return
+        self.members.append((path, tarinfo.name, tarinfo.size, tarinfo.mtime, digest.hexdigest()))
+        self.source_bytes += tarinfo.size
+
+
+    def close(self):
+        try:
+            self.tar.close()
+            if self.stream:
+                self.stream.close()
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        except (OSError, tarfile.TarError) as e:
+            self.error = self.error or str(e)
+        finally:
+            self.file.close()
+
+
+    def verify(self):
+        """
+        Метод читает архив заново и проверяет, что каждый записанный файл присутствует с тем же размером и хэшем.
+        """
+        expected = {name: (size, digest) for _, name, size, _, digest in self.members}
+        with open(self.part_path, "rb") as file:
+            stream = zstandard.ZstdDecompressor().stream_reader(file) if self.compression == "zst" else None
+            with tarfile.open(fileobj=stream, mode="r|") if stream else tarfile.open(fileobj=file, mode="r|*") as tar:
+                for member in tar:
+                    if member.name not in expected:
+                        continue
+                    digest = hashlib.blake2b(digest_size=16)
+                    size = 0
+                    reader = tar.extractfile(member)
+                    while chunk := reader.read(1024 * 1024):
+                        digest.update(chunk)
+                        size += len(chunk)
+                    if (size, digest.hexdigest()) != expected.pop(member.name):
+                        return False
+        return not expected
+
+
+
+class Archiver:
+    """
+    Архивирование перед удалением (Archive): устаревшие файлы правила записываются в архивы tar в каталоге Archive,
+    а удаляются только после проверки архива. Файлы распределяются через очередь между archive-workers потоками,
+    каждый поток пишет свой архив, поэтому сжатие выполняется параллельно (zlib, lzma и zstandard освобождают GIL).
+    Архив закрывается и проверяется, когда объём исходных данных достигает ArchiveMaxSize, и в конце обхода.
+    Удаление выполняется в потоке обхода (safe_remove) и пропускает файлы, изменившиеся после записи в архив.
+    Очередь ограничена: если сжатие не успевает, обход ждёт, но не дольше, чем до остановки обхода (stop_check).
+    Ошибка записи архива (в том числе tarfile и zstandard) помечает архив как неудачный, а поток продолжает разбирать очередь.
+    """
+    QUEUE_SIZE = 256
+    PUT_TIMEOUT = 0.5  # Интервал проверки остановки при ожидании места в очереди, секунды
+    EXTENSIONS = {"gz": ".tar.gz", "xz": ".tar.xz", "zst": ".tar.zst"}
+
+    def __init__(self, mr_clean, rule, stop_check=None):
+        self.mr_clean = mr_clean
+        self.logger = mr_clean.logger
+        self.rule = rule
+        self.stop_check = stop_check or (lambda: mr_clean.stop_requested)
+        self.compression = rule.archive_format
+        if self.compression == "zst" and zstandard is None:
+            self.logger.warning(f"[{rule.section}] Библиотека zstandard не установлена — архивы сжимаются в gz.")
+            self.compression = "gz"
+        os.makedirs(rule.archive, exist_ok=True)
+        self.stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self.verified = queue.Queue()  # Проверенные архивы, исходные файлы которых можно удалить
+        self.workers = [threading.Thread(target=self.work, daemon=True) for _ in range(mr_clean.archive_workers)]
+        for worker in self.workers:
+            worker.start()
+
+
+    def add(self, path, size):
+        if self.put(path, self.stop_check):
+            self.remove_verified()
+
+
+    def put(self, item, stop_check=None):
+        """
+        Метод кладёт элемент в очередь, периодически проверяя остановку и наличие работающих потоков.
+        Возвращает False, если элемент не поставлен в очередь.
+        """
+        while True:
+            try:
+                self.queue.put(item, timeout=self.PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                if stop_check and stop_check():
+                    return False
+                if not any(worker.is_alive() for worker in self.workers):
+                    self.logger.error(f"[{self.rule.section}] Потоки архивирования остановлены — файл {item} не архивирован.")
+                    return False
+
+
+    def next_path(self):
+        """
+        Метод возвращает имя следующего архива; имена существующих архивов (например, от запуска в ту же секунду) пропускаются.
+        """
+        with self.lock:
+            while True:
+                self.sequence += 1
+                name = f"{self.rule.section}-{self.stamp}-{self.sequence:04d}{self.EXTENSIONS[self.compression]}"
+                path = os.path.join(self.rule.archive, re.sub(r'[\\/:*?"<>|]', "_", name))
+                if not os.path.exists(path) and not os.path.exists(path + ".part"):
+                    return path
+
+
+    def work(self):
+        archive = None
+        while (path := self.queue.get()) is not None:
+            if self.mr_clean.stop_requested:
+                continue  # Очередь освобождается, чтобы обход не ждал
+            try:
+                if archive is None:
+                    archive = ArchiveWriter(self.next_path(), self.compression)
+            except Exception as e:
+                self.logger.error(f"[{self.rule.section}] Не удалось создать архив: {e}")
+                continue
+            try:
+                archive.add(path, os.path.relpath(path, self.rule.path))
+            except Exception as e:  # Ошибки сжатия не должны останавливать поток, иначе обход будет ждать место в очереди
+                archive.error = archive.error or f"{path}: {e}"
+            if archive.error or archive.source_bytes >= self.rule.archive_max_size:
+                self.finish_archive(archive)
+                archive = None
+        if archive:
+            self.finish_archive(archive)
+
+
+    def finish_archive(self, archive):
+        try:
+            archive.close()
+        except Exception as e:
+            archive.error = archive.error or str(e)
+        if not archive.error and not self.mr_clean.stop_requested:
+            try:
+                if not archive.verify():
+                    archive.error = "содержимое архива не совпадает с исходными файлами"
+            except Exception as e:  # OSError, EOFError, tarfile.TarError, ошибки zstandard
+                archive.error = str(e)
+        if archive.error or self.mr_clean.stop_requested:
+            if archive.error:
+                self.logger.error(f"[{self.rule.section}] Архив {archive.path} не записан ({archive.error}) — файлы не удалены.")
+            try:
+                os.remove(archive.part_path)
+            except OSError:
+                pass
+            return
+        try:
+            os.replace(archive.part_path, archive.path)
+        except OSError as e:
+            self.logger.error(f"[{self.rule.section}] Не удалось переименовать архив {archive.part_path}: {e}")
+            return
+        self.verified.put(archive)
+
+
+    def remove_verified(self):
+        """
+        Метод удаляет исходные файлы проверенных архивов. Файл, размер или время изменения которого изменились
+        после записи в архив, не удаляется.
+        """
+        while True:
+            try:
+                archive = self.verified.get_nowait()
+            except queue.Empty:
+                return
+            self.logger.info(
+                f"[{self.rule.section}] Архив {archive.path}: файлов {len(archive.members)}, "
+                f"исходный объём {format_size(archive.source_bytes)}, размер архива {format_size(os.path.getsize(archive.path))}."
+            )
+            for path, _, size, mtime, _ in archive.members:
+                try:
+                    stats = os.lstat(path)
+                except OSError:
+                    continue
+                if stats.st_size != size or stats.st_mtime != mtime:
+                    self.logger.warning(f"Файл {path} изменился после архивирования — не удаляется.")
+                    continue
+                self.mr_clean.safe_remove(path, size=size, rule=self.rule)
+
+
+    def close(self):
+        """
+        Метод дожидается записи и проверки всех архивов и удаляет исходные файлы.
+        """
+        for _ in self.workers:
+            self.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.remove_verified()
+
+
+
+class CleanupTraversal:
+    """
+    Единый обход для группы правил с вложенными или совпадающими каталогами: каждый каталог читается один раз.
+    К каждому элементу применяются все правила, в область которых он входит, в порядке приоритета:
+    сначала правила более глубоких каталогов, затем в порядке секций values.ini. Элемент удаляет первое правило,
+    признавшее его устаревшим, поэтому результат совпадает с последовательным выполнением секций.
+    Методы по Days:
+    - 0: файлы (без маски), подкаталоги после обработки их содержимого и сам корневой каталог;
+    - 1: подкаталоги любого уровня до спуска в них (удалённый каталог не обходится);
+    - 2, 3, 4: файлы по маске во всех подкаталогах (для метода 3 маска "*.*" означает все файлы).
+    Правила остальных режимов получают кандидатов через RuleCollector и удаляют их после обхода.
+    Exclude и Prune проверяются по имени элемента из списка каталога до любых запросов метаданных:
+    каталог, который пропускают все действующие правила, не читается вовсе.
+    Для масок с путями (PathMask) состояние автомата передаётся в подкаталоги: правило не спускается туда,
+    где его маска уже не может совпасть.
+    Символические ссылки и точки соединения (junction) никогда не считаются обычными каталогами: по политике Symlinks
+    правило удаляет саму ссылку (remove), пропускает её (skip) или заходит в каталог назначения (follow).
+    Правило с OneFileSystem не заходит в точки монтирования (на Linux они определяются по /proc/self/mountinfo
+    без обращения к самим каталогам, поэтому недоступный сетевой ресурс не блокирует обход).
+    Правила с RemoveEmptyDirs удаляют подкаталоги, в которых после обработки не осталось элементов: каждый каталог
+    считает оставшиеся элементы (прочитанные минус удалённые), поэтому пустота определяется снизу вверх в том же обходе
+    без повторного чтения каталога.
+    Каталог читается через os.scandir порциями по batch-size элементов, и каждая порция обрабатывается до чтения
+    следующей: в памяти держатся только текущая порция и подкаталоги, поэтому каталог с миллионами файлов
+    не требует списка всех имён, а удаление начинается сразу.
+    В резидентном режиме каталоги, где действуют только правила по Days для файлов, заносятся в индекс
+    (время изменения каталога, подкаталоги, время устаревания ближайшего файла): пока каталог не изменился
+    и ни один файл не мог устареть, список каталога не читается.
+    """
+    def __init__(self, mr_clean, rules):
+        self.mr_clean = mr_clean
+        self.logger = mr_clean.logger
+        self.rules = rules  # Первым идёт правило корневого каталога группы
+        self.root_path = rules[0].path
+        self.rules_by_key = {}
+        for rule in rules:
+            self.rules_by_key.setdefault(rule.key, []).append(rule)
+        self.cutoffs = {rule: rule.cutoff_date().timestamp() for rule in rules}
+        self.limiters = {rule: mr_clean.get_rate_limiter(rule) for rule in rules}  # None - скорость не ограничена
+        self.archivers = {}  # Правила с Archive -> Archiver
+        # Каталоги на пути от корня группы к корням вложенных правил: в них спускаемся, даже если все действующие правила их пропускают
+        self.root_prefixes = set()
+        for rule in rules[1:]:
+            key = rule.key
+            while len(key) > len(rules[0].key) and key not in self.root_prefixes:
+                self.root_prefixes.add(key)
+                key = os.path.dirname(key)
+        self.collectors = {}
+        self.time_checker = None
+        self.stopped = False
+        self.root_devices = {}  # Устройство корневого каталога правила для OneFileSystem
+        self.followed = set()  # Каталоги назначения ссылок, в которые уже заходили (защита от циклов)
+        self.index = mr_clean.dir_index  # Индекс каталогов резидентного режима (None - не используется)
+        self.skip_name = mr_clean.quarantine.dir_name if mr_clean.quarantine else None  # Каталоги карантина не обходятся
+        self.last_removed = 0  # Количество файлов, удалённых при последнем вызове process_files
+        self.last_empty = False  # В последнем обойдённом каталоге не осталось элементов
+        self.last_changed = False  # В последнем обойдённом поддереве что-то удалено
+        # Ключи точек монтирования внутри группы: граница файловой системы определяется без обращения к каталогу
+        self.mount_keys = None
+        mount_points = get_mount_points() if IS_LINUX and any(rule.one_file_system for rule in rules) else None
+        if mount_points is not None:
+            real_root = os.path.realpath(self.root_path).rstrip(os.sep) + os.sep
+            self.mount_keys = {
+                os.path.join(rules[0].key, os.path.normcase(os.path.relpath(mount_point, real_root)))
+                for mount_point in mount_points if mount_point.startswith(real_root) and mount_point.rstrip(os.sep) + os.sep != real_root
+            }
+
+
+    def run(self):
+        """
+        Метод выполняет обход группы, а затем завершает работу накопителей (выбор и удаление кандидатов).
+        """
+        self.time_checker = TimeChecker(self.mr_clean.cycle_time_limit_sec)
+        self.time_checker.start()
+        try:
+            for rule in self.rules:
+                if rule.mode in COLLECTORS:
+                    self.collectors[rule] = COLLECTORS[rule.mode](self.mr_clean, rule)
+                if rule.archive:
+                    self.archivers[rule] = Archiver(self.mr_clean, rule, self.should_stop)
+
+            self.visit(self.root_path, self.rules[0].key, (), {})
+
+            for collector in self.collectors.values():
+                if self.should_stop():
+                    break
+                self.time_checker.reset_timer()
+                collector.finish(self)
+        except Exception as e:
+            self.logger.error(f"Ошибка при обработке пути {self.root_path}: {e}")
+        finally:
+            for archiver in self.archivers.values():
+                archiver.close()
+            for collector in self.collectors.values():
+                collector.close()
+            self.time_checker.stop_event.set()
+            self.time_checker.join()
+
+
+    def should_stop(self):
+        """
+        Метод проверяет принудительное завершение и превышение лимита времени цикла.
+        """
+        if self.stopped:
+            return True
+        if self.mr_clean.stop_requested:
+            self.stopped = True
+        elif self.time_checker.is_time_up():
+            self.logger.warning(f"Цикл {self.root_path} работает дольше {self.mr_clean.cycle_time_limit_sec} сек. — пропускаем.")
+            self.stopped = True
+        return self.stopped
+
+
+    def get_time(self, entry, rule, cache):
+        """
+        Метод возвращает (время, размер) элемента, запрашивая метаданные не более одного раза на источник времени.
+        Запрос расходует бюджет операций правила.
+        """
+        key = (entry.name, rule.time_source)
+        if key not in cache:
+            if self.limiters[rule]:
+                self.limiters[rule].acquire()
+            cache[key] = self.mr_clean.get_entry_time(entry, rule.time_source)
+        return cache[key]
+
+
+    def visit(self, path, key, active, states):
+        """
+        Метод обходит каталог и его поддерево без рекурсии: состояние каждого каталога на пути от корня хранится
+        в кадре (Frame) на явном стеке, поэтому глубина дерева не ограничена глубиной рекурсии Python.
+        active - правила, действующие в каталоге, в порядке приоритета, states - состояния PathMask этих правил.
+        Возвращает суммарный размер оставшихся файлов поддерева, если он нужен правилам метода 1
+        с выбором по объёму (иначе 0).
+        """
+        stack = [self.enter(path, key, active, states)]
+        while True:
+            frame = stack[-1]
+            child = None if self.stopped else self.next_child(frame)
+            if self.stopped:
+                return stack[0].size
+            if child:
+                stack.append(self.enter(*child))
+                continue
+            size = self.leave(frame)
+            stack.pop()
+            if not stack:
+                return size
+            self.child_done(stack[-1], size)
 
+
+    class Frame:
+        """
+        Состояние обхода одного каталога: действующие правила, оставшиеся подкаталоги (итератор),
+        накопленный размер и счётчики для RemoveEmptyDirs.
+        """
+        __slots__ = ("path", "key", "active", "states", "rules_here", "writable", "cache", "size", "remaining", "changed",
+                     "subdirs", "indexed", "complete", "child")
+
+        def __init__(self, path, key, active, states, rules_here):
+            self.path = path
+            self.key = key
+            self.active = active
+            self.states = states
+            self.rules_here = rules_here
+            self.writable = False
+            self.cache = {}  # Метаданные подкаталогов
+            self.size = 0
+            self.remaining = 0  # Элементы, оставшиеся в каталоге (для RemoveEmptyDirs)
+            self.changed = False  # В поддереве что-то удалено
+            self.subdirs = iter(())
+            self.indexed = False  # Каталог обходится по индексу: subdirs содержит имена подкаталогов
+            self.complete = False  # Каталог прочитан полностью (иначе - ошибка чтения или остановка)
+            self.child = None  # Подкаталог, который обходится сейчас: (элемент, ссылка ли, ключ, действующие правила)
+
+
+    def enter(self, path, key, active, states):
+        """
+        Метод читает каталог, обрабатывает его файлы и возвращает кадр обхода с подкаталогами.
+        """
+        self.last_empty = self.last_changed = False
+        rules_here = self.rules_by_key.get(key, [])
+        if rules_here:
+            active = tuple(rules_here) + active
+            states = {**states, **{rule: rule.path_mask.start for rule in rules_here if rule.path_mask}}
+        frame = self.Frame(path, key, active, states, rules_here)
+        if self.should_stop():
+            return frame
+
+        # Индекс резидентного режима: время изменения читается до списка каталога, чтобы не пропустить параллельные изменения
+        index_key = (key, active) if self.is_indexable(active) else None
+        if index_key:
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                index_key = None
+            else:
+                indexed = self.index.get(index_key)
+                if indexed and indexed[0] == mtime_ns and time.time() < indexed[2]:
+                    # Каталог не изменялся, и ни один его файл ещё не мог устареть: список каталога не читается,
+                    # обход продолжается по сохранённому списку подкаталогов
+                    self.mr_clean.progress.dirs_scanned += 1
+                    frame.indexed = frame.complete = True
+                    frame.subdirs = iter(indexed[1])
+                    return frame
+
+        # Чтение каталога - одна операция в бюджете правила с наивысшим приоритетом
+        limiter = self.limiters[active[0]] if active else self.mr_clean.rate_limiter
+        if limiter:
+            limiter.acquire()
+        writable = os.access(path, os.R_OK | os.W_OK)
+        if not writable:  # Проверяем доступ к текущей директории
+            self.logger.error(f"Недостаточно прав для чтения/записи в директории: {path} — пропускаем.")
+
+        need_size = any(rule.method == "1" and rule in self.collectors and self.collectors[rule].NEEDS_SIZE for rule in active)
+        follow = any(rule.symlinks == "follow" for rule in active)
+        pending = [] if index_key else None
+        self.last_removed = 0
+        dirs, links = [], []  # Подкаталоги и ссылки, по которым может понадобиться перейти (follow)
+        entries_read = 0
+        progress = self.mr_clean.progress  # Счётчики хода обновляются один раз на порцию
+        # Каталог читается порциями по batch_size элементов, и файлы каждой порции обрабатываются сразу:
+        # память не зависит от количества файлов в каталоге, а удаление начинается до окончания чтения.
+        # Элементы, появившиеся или удалённые во время чтения, могут быть пропущены и будут обработаны при следующем обходе.
         try:
-            for root, dirs, _ in os.walk(path):
-                if self.is_forced_exit:
-                    return
-                
-                if not os.access(root, os.R_OK | os.W_OK):  # Проверяем доступ к текущей директории
-                    self.logger.error(f"Недостаточно прав для чтения/записи в директории: {root} — пропускаем.")
-                    continue
+            with os.scandir(path) as iterator:
+                progress.dirs_scanned += 1
+                while chunk := list(itertools.islice(iterator, self.mr_clean.batch_size)):
+                    entries_read += len(chunk)
+                    files = []
+                    for entry in chunk:
+                        try:
+                            if entry.is_symlink() or entry.is_junction():
+                                files.append(entry)
+                                if follow:
+                                    links.append(entry)
+                            elif entry.is_dir(follow_symlinks=False):
+                                dirs.append(entry)
+                            else:
+                                files.append(entry)
+                        except OSError:
+                            files.append(entry)
+                    progress.files_scanned += len(files)
+                    if writable and files:
+                        frame.size += self.process_files(files, active, states, {}, need_size, pending)
+                        if self.stopped:
+                            return frame
+        except PermissionError:
+            self.logger.error(f"Недостаточно прав для чтения директории: {path} — пропускаем.")
+            return frame
+        except OSError as e:
+            self.logger.error(f"Ошибка при обработке директории {path}: {e}")
+            return frame
+        frame.writable = writable
+        frame.remaining = entries_read - self.last_removed
+        frame.changed = self.last_removed > 0
+        # Каталог, в котором ничего не удалено, заносится в индекс; иначе его время изменения уже не совпадает с прочитанным.
+        # После остановки обработка могла прерваться на середине каталога (select_expired выходит досрочно),
+        # и pending описывает не все файлы, поэтому такой каталог в индекс не заносится
+        if index_key and writable and not self.last_removed and not self.should_stop():
+            next_due = min(pending, default=float("inf"))
+            self.index[index_key] = (mtime_ns, tuple(entry.name for entry in dirs), min(next_due, time.time() + self.mr_clean.DIR_INDEX_TTL))
+
+        # Ссылки на каталоги обходятся только правилами с политикой follow
+        subdirs = [(entry, False) for entry in dirs]
+        subdirs += [(entry, True) for entry in links if self.follow_link(path, entry)]
+        frame.subdirs = iter(subdirs)
+        frame.complete = True
+        return frame
+
+
+    def next_child(self, frame):
+        """
+        Метод возвращает аргументы enter() для следующего подкаталога, в который нужно спуститься, или None.
+        Подкаталоги, удалённые методом 1 целиком, и подкаталоги без действующих правил пропускаются.
+        """
+        for item in frame.subdirs:
+            if self.should_stop():
+                return None
+            if frame.indexed:
+                entry, linked = None, False
+                name, child_path = item, os.path.join(frame.path, item)
+            else:
+                entry, linked = item
+                name, child_path = entry.name, entry.path
+            if name == self.skip_name:
+                continue
 
-                for dir_name in dirs:
-                    if self.is_forced_exit:
-                        return
+            # Правила, которые продолжают действовать в подкаталоге (Prune, PathMask, Symlinks, OneFileSystem)
+            child_key = os.path.join(frame.key, os.path.normcase(name))
+            child_active, child_states = self.descend(name, child_path, child_key, frame.active, frame.states, linked)
+            if not child_active and (linked or child_key not in self.root_prefixes):
+                continue
 
-                    if time_checker.is_time_up():
-                        self.logger.warning(f"Цикл {path} работает дольше {self.cycle_time_limit_sec} сек. — пропускаем.")
-                        time_checker.stop_event.set()
-                        return
+            # Метод 1: устаревший подкаталог удаляется целиком, без спуска в него
+            if entry and frame.writable and not linked and self.remove_expired_dir(entry, child_active, "1", frame.cache):
+                frame.remaining -= 1
+                frame.changed = True
+                continue
+            frame.child = (entry, linked, child_key, child_active)
+            return child_path, child_key, child_active, child_states
+        return None
 
-                    dir_path = os.path.join(root, dir_name)
 
-                    # Проверяем существование каталога и права доступа
-                    if not os.path.exists(dir_path) or not os.access(dir_path, os.R_OK | os.W_OK):
-                        self.logger.warning(f"Каталог {dir_path} не существует или недоступен — пропускаем.")
-                        continue
+    def child_done(self, frame, child_size):
+        """
+        Метод обрабатывает подкаталог после обхода его содержимого (last_empty и last_changed описывают подкаталог):
+        метод 0, RemoveEmptyDirs, размер поддерева и кандидаты метода 1 для накопителей.
+        """
+        entry, linked, child_key, child_active = frame.child
+        frame.child = None
+        if entry is None:  # Каталог по индексу
+            return
+        child_empty, child_changed = self.last_empty, self.last_changed
+        frame.changed = frame.changed or child_changed
+
+        # Метод 0: подкаталог проверяется после обработки его содержимого
+        if frame.writable and not linked and self.remove_expired_dir(entry, child_active, "0", frame.cache):
+            frame.remaining -= 1
+            frame.changed = True
+            return
+        # RemoveEmptyDirs: опустевший подкаталог (кроме корневых каталогов правил) удаляется
+        if (frame.writable and not linked and child_empty and child_key not in self.rules_by_key and child_key not in self.root_prefixes
+                and self.remove_empty_dir(entry, child_active, frame.cache, child_changed)):
+            frame.remaining -= 1
+            frame.changed = True
+            return
+        frame.size += child_size
+
+        # Кандидаты метода 1 для правил с выбором по объёму - подкаталоги первого уровня
+        for rule in frame.rules_here:
+            if linked:
+                break
+            if rule.method == "1" and rule in self.collectors and rule in child_active and not rule.is_excluded(entry.name):
+                try:
+                    creation_time, _ = self.get_time(entry, rule, frame.cache)
+                    self.collectors[rule].add(creation_time, child_size, entry.path, True)
+                except OSError as e:
+                    self.logger.error(f"Ошибка при обработке каталога {entry.path}: {e}")
 
-                    try:
-                        creation_date = datetime.datetime.fromtimestamp(self.get_creation_time(dir_path))
-                        if creation_date < date:
-                            self.safe_remove(dir_path, is_dir=True)
-                    except Exception as e:
-                        self.logger.error(f"Ошибка при обработке каталога {dir_path}: {e}")
 
-                # Сброс таймера после обработки каждого каталога (опционально)
-                time_checker.reset_timer()
+    def leave(self, frame):
+        """
+        Метод завершает обработку каталога после всех подкаталогов и возвращает размер его поддерева.
+        Устанавливает last_empty и last_changed (для RemoveEmptyDirs в родительском каталоге).
+        """
+        self.last_empty = self.last_changed = False
+        if not frame.complete:
+            return frame.size
+        if frame.indexed:
+            self.time_checker.reset_timer()
+            return 0
+
+        # Метод 0: сам корневой каталог правила проверяется после обработки его содержимого.
+        # Ошибка чтения времени не прерывает обход группы: каталог считается неустаревшим
+        for rule in frame.rules_here:
+            if rule.method == "0" and rule.mode == "age" and os.access(frame.path, os.R_OK | os.W_OK):
+                try:
+                    expired = self.mr_clean.get_creation_time(frame.path, rule.time_source) < self.cutoffs[rule]
+                except (OSError, ValueError) as e:
+                    self.logger.error(f"Ошибка при обработке каталога {frame.path}: {e}")
+                    continue
+                if expired:
+                    self.mr_clean.safe_remove(frame.path, is_dir=True, rule=rule)
+                    return 0
 
-        except Exception as e:
-            self.logger.error(f"Ошибка при обработке пути {path}: {e}")
-        finally:
-            time_checker.stop_event.set()
-            time_checker.join()
+        # Сброс таймера после обработки каждого каталога
+        self.time_checker.reset_timer()
+        self.last_empty, self.last_changed = frame.remaining <= 0, frame.changed
+        return frame.size
 
 
-    def delete_only_files(self, path, date, mask_patterns):  # Метод 2
+    def is_indexable(self, active):
         """
-        Удаляет только файлы по указанному пути, если они старше указанного количества дней.
+        Метод проверяет, можно ли пропускать каталог по индексу: индекс включён, и в каталоге действуют только
+        правила по Days для файлов (методы 2, 3, 4) без перехода по ссылкам и без RemoveEmptyDirs.
         """
-        time_checker = TimeChecker(self.cycle_time_limit_sec)
-        time_checker.start()
+        return self.index is not None and bool(active) and all(
+            rule.mode == "age" and rule.method in ("2", "3", "4") and rule.symlinks != "follow" and not rule.remove_empty for rule in active
+        )
 
-        try:
-            for root, _, files in os.walk(path):
-                if self.is_forced_exit:
-                    return
 
-                if not os.access(root, os.R_OK | os.W_OK):  # Проверяем доступ к текущей директории
-                    self.logger.error(f"Недостаточно прав для чтения/записи в директории: {root} — пропускаем.")
+    def descend(self, name, child_path, child_key, active, states, linked=False):
+        """
+        Метод возвращает правила, которые продолжают действовать в подкаталоге, и их состояния PathMask.
+        Правило отбрасывается, если подкаталог подходит под Prune, маска правила не может совпасть
+        ни с одним файлом поддерева, подкаталог является ссылкой, а политика правила не follow,
+        или подкаталог находится на другой файловой системе, а у правила задан OneFileSystem.
+        """
+        child_active, child_states = [], {}
+        devices = {}  # st_dev подкаталога: запрашивается не более одного раза и сравнивается с корнем каждого правила
+        for rule in active:
+            if rule.is_pruned(name) or linked and rule.symlinks != "follow":
+                continue
+            if rule in states:
+                state = rule.path_mask.step(states[rule], name)
+                if not state:
                     continue
+                child_states[rule] = state
+            if rule.one_file_system and self.crosses_device(rule, child_path, child_key, linked, devices):
+                self.logger.debug(f"Каталог {child_path} находится на другой файловой системе — пропускаем.")
+                continue
+            child_active.append(rule)
+        return tuple(child_active), child_states
 
-                for file_name in files:
-                    if self.is_forced_exit:
-                        return
 
-                    if time_checker.is_time_up():
-                        self.logger.warning(f"Цикл {path} работает дольше {self.cycle_time_limit_sec} сек. — пропускаем.")
-                        time_checker.stop_event.set()
-                        return
+    def crosses_device(self, rule, child_path, child_key, linked, devices):
+        """
+        Метод проверяет, находится ли подкаталог на другой файловой системе, чем корневой каталог правила.
+        На Linux обычные подкаталоги сверяются со списком точек монтирования без обращения к диску,
+        в остальных случаях st_dev подкаталога сравнивается с устройством корня этого правила
+        (devices - кэш st_dev подкаталога для всех правил одного вызова descend).
+        """
+        if self.mount_keys is not None and not linked:
+            return child_key in self.mount_keys
+        try:
+            if rule not in self.root_devices:
+                self.root_devices[rule] = os.stat(rule.path).st_dev
+            if child_path not in devices:
+                devices[child_path] = os.stat(child_path).st_dev
+            return devices[child_path] != self.root_devices[rule]
+        except OSError:
+            return True
 
-                    file_path = os.path.join(root, file_name)
 
-                    # Проверяем существование файла и права доступа
-                    if not os.path.exists(file_path) or not os.access(file_path, os.R_OK | os.W_OK):
-                        self.logger.warning(f"Файл {file_path} не существует или недоступен — пропускаем.")
-                        continue
+    def follow_link(self, path, entry):
+        """
+        Метод проверяет, можно ли зайти по ссылке: назначение должно быть каталогом, который ещё не обходился
+        по другой ссылке и не является каталогом-предком (иначе обход зациклится).
+        """
+        try:
+            if not entry.is_dir():
+                return False
+            target = os.path.normcase(os.path.realpath(entry.path))
+            here = os.path.normcase(os.path.realpath(path))
+        except OSError:
+            return False
+        if target in self.followed or here == target or here.startswith(target.rstrip(os.sep) + os.sep):
+            self.logger.warning(f"Ссылка {entry.path} ведёт в уже обработанный каталог {target} — пропускаем.")
+            return False
+        self.followed.add(target)
+        return True
+
+
+    def match_file(self, rule, states, entry):
+        """
+        Метод проверяет, подходит ли файл под маску правила, не исключён ли он (Exclude)
+        и разрешает ли политика Symlinks удалить его, если это ссылка.
+        """
+        if rule.is_excluded(entry.name):
+            return False
+        if entry.is_symlink() or entry.is_junction():
+            if rule.symlinks == "skip":
+                return False
+            if rule.symlinks == "follow":
+                # Ссылка на каталог обходится, но сама не удаляется; битая ссылка удаляется как файл
+                try:
+                    if entry.is_dir():
+                        return False
+                except OSError:
+                    pass
+        if rule in states:
+            return rule.path_mask.match(states[rule], entry.name)
+        return rule.file_regex is None or rule.file_regex.match(entry.name) is not None
 
-                    # Проверяем, соответствует ли файл шаблонам Mask
-                    if not any(fnmatch.fnmatch(file_name.lower(), pattern.lower()) for pattern in mask_patterns):
+
+    def process_files(self, files, active, states, cache, need_size, pending=None):
+        """
+        Метод применяет к файлам каталога правила по Days (пакетно через select_expired) и передаёт
+        оставшиеся файлы накопителям. Возвращает суммарный размер оставшихся файлов, если need_size.
+        Если передан список pending, в него добавляется время, когда устареет ближайший из оставшихся файлов.
+        """
+        remaining = files
+        has_links = any(entry.is_symlink() or entry.is_junction() for entry in files)
+        for rule in active:
+            if rule.method == "1" or rule.mode != "age":
+                continue
+            selected = set()
+            if rule in states or rule.exclude or has_links and rule.symlinks != "remove":
+                # Маска с путями, Exclude и политика ссылок проверяются заранее, select_expired получает уже отобранные файлы
+                candidates = [entry for entry in remaining if self.match_file(rule, states, entry)]
+                mask = None
+            else:
+                candidates = remaining
+                mask = rule.file_regex
+            oldest = [] if pending is not None else None
+            limiter = self.limiters[rule]
+            for entry, size in self.mr_clean.select_expired(candidates, self.cutoffs[rule], mask, rule.time_source, oldest, True, limiter, cache):
+                if self.should_stop():
+                    return 0
+                selected.add(entry.name)
+                if rule in self.archivers:  # Файл удаляется после записи и проверки архива
+                    self.archivers[rule].add(entry.path, size)
+                else:
+                    self.mr_clean.safe_remove(entry.path, size=size, rule=rule)
+            if oldest:
+                pending.append(min(oldest) + rule.days * 86400)
+            if selected:
+                self.last_removed += len(selected)
+                remaining = [entry for entry in remaining if entry.name not in selected]
+
+        collectors = [(rule, self.collectors[rule]) for rule in active if rule in self.collectors and rule.method != "1"]
+        size = 0
+        for entry in remaining:
+            try:
+                for rule, collector in collectors:
+                    if not self.match_file(rule, states, entry):
                         continue
+                    creation_time, file_size = self.get_time(entry, rule, cache)
+                    collector.add(creation_time, file_size, entry.path, False)
+                if need_size:
+                    size += entry.stat(follow_symlinks=False).st_size
+            except OSError as e:
+                self.logger.error(f"Ошибка при обработке файла {entry.path}: {e}")
+
+        # Оставленные файлы для отчёта: размер берётся из уже прочитанных метаданных
+        report = self.mr_clean.report
+        if report and remaining and cache:
+            time_sources = {rule.time_source for rule in active}
+            retained = []
+            for entry in remaining:
+                for time_source in time_sources:
+                    known = cache.get((entry.name, time_source))
+                    if known:
+                        retained.append((entry.name, known[1]))
+                        break
+            report.add_retained(os.path.dirname(remaining[0].path), retained)
+        return size
+
+
+    def remove_empty_dir(self, entry, active, cache, emptied):
+        """
+        Метод удаляет пустой подкаталог по правилу с RemoveEmptyDirs. Каталог, опустевший в этом обходе (emptied), удаляется сразу,
+        а пустой с прошлых запусков - если он старше Days. Используется os.rmdir: если в каталоге успели появиться
+        элементы, он не удаляется.
+        """
+        for rule in active:
+            if not rule.remove_empty or rule.is_excluded(entry.name):
+                continue
+            if not emptied:
+                try:
+                    creation_time, _ = self.get_time(entry, rule, cache)
+                except OSError as e:
+                    self.logger.error(f"Ошибка при обработке каталога {entry.path}: {e}")
+                    return False
+                if creation_time >= self.cutoffs[rule]:
+                    continue
+            if self.limiters[rule]:
+                self.limiters[rule].acquire()
+            try:
+                os.rmdir(entry.path)
+            except OSError as e:
+                self.logger.debug(f"Каталог {entry.path} не удалён: {e}")
+                return False
+            self.mr_clean.progress.dirs_removed += 1
+            if self.mr_clean.journal:
+                self.mr_clean.journal.write(entry.path, 0, rule, True)
+            self.logger.info(f"Удалён пустой каталог: {entry.path}")
+            print(f"Удалён пустой каталог: {entry.path}")  # Вывод в консоль
+            return True
+        return False
+
+
+    def remove_expired_dir(self, entry, active, method, cache):
+        """
+        Метод удаляет подкаталог, если его признаёт устаревшим правило указанного метода (0 или 1) по Days.
+        """
+        for rule in active:
+            if rule.method != method or rule.mode != "age" or rule.is_excluded(entry.name):
+                continue
+            try:
+                creation_time, _ = self.get_time(entry, rule, cache)
+            except OSError as e:
+                self.logger.error(f"Ошибка при обработке каталога {entry.path}: {e}")
+                return False
+            if creation_time < self.cutoffs[rule]:
+                self.mr_clean.safe_remove(entry.path, is_dir=True, rule=rule)
+                return True
+        return False
 
-                    try:
-                        creation_date = datetime.datetime.fromtimestamp(self.get_creation_time(file_path))
-                        if creation_date < date:
-                            self.safe_remove(file_path)
-                    except PermissionError as e:
-                        self.logger.error(f"Ошибка доступа при обработке файла {file_path}: {e}")
-                    except FileNotFoundError:
-                        self.logger.warning(f"Файл не найден: {file_path}")
-                    except Exception as e:
-                        self.logger.error(f"Ошибка при обработке файла {file_path}: {e}")
 
-                # Сброс таймера после обработки каждого каталога (опционально)
-                time_checker.reset_timer()
 
-        except Exception as e:
-            self.logger.error(f"Ошибка при обработке пути {path}: {e}")
-        finally:
-            time_checker.stop_event.set()
-            time_checker.join()
+class RunProgress:
+    """
+    Ход одного запуска очистки. Счётчики проверенных элементов обновляются один раз на каталог,
+    счётчики удалённых - при удалении, поэтому проверка отдельных файлов не замедляется.
+    Оставшееся время оценивается по количеству элементов (каталогов и файлов) предыдущего запуска тех же секций.
+    """
+    COUNTERS = ("dirs_scanned", "files_scanned", "files_removed", "dirs_removed", "dir_entries_removed", "bytes_freed", "quarantined", "errors")
+
+    def __init__(self, expected_entries=None):
+        self.started = time.monotonic()
+        self.section = None
+        self.expected_entries = expected_entries
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+
+
+    @property
+    def entries(self):
+        return self.dirs_scanned + self.files_scanned
 
 
-    def delete_files_in_subfolders(self, path, date, mask_patterns):  # Метод 3
+    def snapshot(self):
         """
-        Рекурсивное удаление файлов в подкаталогах.
+        Метод возвращает счётчики, скорость обхода (элементов в секунду) и оценку оставшегося времени (None - нет оценки).
         """
-        self.logger.debug(f"Начинается рекурсивное удаление файлов в подкаталоге: {path}")
-        time_checker = TimeChecker(self.cycle_time_limit_sec)
-        time_checker.start()
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        eta = None
+        if self.expected_entries and 0 < self.entries < self.expected_entries:
+            eta = (self.expected_entries - self.entries) * elapsed / self.entries
+        return {
+            "section": self.section,
+            "elapsed_sec": round(elapsed, 1),
+            "dirs_per_sec": round(self.dirs_scanned / elapsed, 1),
+            "files_per_sec": round(self.files_scanned / elapsed, 1),
+            "eta_sec": round(eta) if eta is not None else None,
+            **{name: getattr(self, name) for name in self.COUNTERS},
+        }
+
+
+    def format(self):
+        """
+        Метод возвращает строку хода запуска для окна, подсказки в трее и консоли.
+        """
+        snapshot = self.snapshot()
+        text = (
+            (f"[{self.section}] " if self.section else "") +
+            f"Каталогов: {self.dirs_scanned} ({snapshot['dirs_per_sec']:.0f}/с), файлов: {self.files_scanned} ({snapshot['files_per_sec']:.0f}/с)."
+            f" Удалено: {self.files_removed + self.dirs_removed}, освобождено: {format_size(self.bytes_freed)}."
+        )
+        if self.quarantined:
+            text += f" В карантин: {self.quarantined}."
+        if snapshot["eta_sec"] is not None:
+            text += f" Осталось ≈ {format_duration(snapshot['eta_sec'])}."
+        return text
 
-        try:
-            for item in os.listdir(path):
-                if self.is_forced_exit:
-                    return
-                
-                if time_checker.is_time_up():
-                    self.logger.warning(f"Цикл {path} работает дольше {self.cycle_time_limit_sec} сек. — пропускаем.")
-                    break
 
-                item_path = os.path.join(path, item)
 
-                if not os.access(item_path, os.R_OK | os.W_OK):  # Проверяем права доступа к текущему элементу
-                    self.logger.error(f"Недостаточно прав для чтения/записи в элементе: {item_path} — пропускаем.")
-                    continue
+class TopN:
+    """
+    Ограниченный набор ключей с наибольшими накопленными значениями (например, объём по каталогам).
+    Значения одного ключа суммируются; когда ключей становится больше size * 4, остаются size * 2 наибольших (heapq.nlargest),
+    поэтому память ограничена, а ключ с небольшим значением может быть вытеснен до того, как накопит больше.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.values = {}
 
-                if os.path.isdir(item_path):
-                    # Сброс таймера перед обработкой нового каталога
-                    time_checker.reset_timer()
-                    self.logger.info("~ ~ ~ ~ ~ ~ ~ ~ ~ ~")
-                    self.logger.info(f"Сканируется подкаталог: {item_path}")
-                    self.delete_files_in_subfolders(item_path, date, mask_patterns)
-                elif os.path.isfile(item_path):
-                    try:
-                        if time_checker.is_time_up():
-                            self.logger.warning(f"Цикл {path} работает дольше {self.cycle_time_limit_sec} сек. — пропускаем.")
-                            break
-
-                        creation_date = datetime.datetime.fromtimestamp(self.get_creation_time(item_path))
-
-                        # Проверяем, соответствует ли файл шаблонам Mask
-                        if mask_patterns == ["*.*"]:
-                            # Если маска равна "*.*", удаляем все файлы без проверки
-                            if os.path.isfile(item_path):
-                                if creation_date < date:
-                                    self.safe_remove(item_path)
-                        else:
-                            # Иначе проверяем соответствие маске
-                            if os.path.isfile(item_path) and mask_patterns and any(fnmatch.fnmatch(os.path.basename(item_path), pattern) for pattern in mask_patterns):
-                                if creation_date < date:
-                                    self.safe_remove(item_path)
-                    except PermissionError as e:
-                        self.logger.error(f"Ошибка доступа при обработке файла {item_path}: {e}")
-                    except FileNotFoundError:
-                        self.logger.warning(f"Файл не найден: {item_path}")
-                    except Exception as e:
-                        self.logger.error(f"Ошибка при обработке файла {item_path}: {e}")
 
-        except Exception as e:
-            self.logger.error(f"Ошибка при обработке пути {path}: {e}")
-        finally:
-            time_checker.stop_event.set()
-            time_checker.join()
+    def add(self, key, value):
+        self.values[key] = self.values.get(key, 0) + value
+        if len(self.values) > self.size * 4:
+            self.values = dict(heapq.nlargest(self.size * 2, self.values.items(), key=lambda item: item[1]))
 
 
-    def delete_only_files_in_folder(self, path, date, mask_patterns):  # Метод 4
-        """
-        Удаление только файлов в указанном каталоге, без удаления каталогов.
-        """
-        self.logger.debug(f"Начинается удаление файлов в каталоге {path}, сохраняя структуру каталогов.")
-        time_checker = TimeChecker(self.cycle_time_limit_sec)
-        time_checker.start()
+    def top(self):
+        return heapq.nlargest(self.size, self.values.items(), key=lambda item: item[1])
 
-        try:
-            for root, _, files in os.walk(path):
-                if self.is_forced_exit:
-                    return
-                
-                if not os.access(root, os.R_OK | os.W_OK):  # Проверяем доступ к текущей директории
-                    self.logger.error(f"Недостаточно прав для чтения/записи в директории: {root} — пропускаем.")
-                    continue
 
-                for file_name in files:
-                    if self.is_forced_exit:
-                        return
-            
-                    if time_checker.is_time_up():
-                        self.logger.warning(f"Цикл {path} работает дольше {self.cycle_time_limit_sec} сек. — пропускаем.")
-                        time_checker.stop_event.set()
-                        return  # Прерываем выполнение, если время истекло
 
-                    file_path = os.path.join(root, file_name)
+class SpaceReport:
+    """
+    Отчёт о занятом месте за один запуск, который собирается во время обхода без дополнительных обращений к диску:
+    каталоги с наибольшим объёмом удалённых и оставленных файлов (TopN) и итоги по расширениям.
+    Оставленными считаются файлы, время которых проверялось правилами: их размер известен из того же запроса метаданных.
+    Удалённые каталоги (методы 0 и 1) учитываются в родительском каталоге.
+    """
+    NO_EXTENSION = "(без расширения)"
+    DIRECTORY = "(каталоги)"
+
+    def __init__(self, top_n):
+        self.top_n = top_n
+        self.removed_dirs = TopN(top_n)
+        self.retained_dirs = TopN(top_n)
+        self.removed_ext = {}  # Расширение -> [количество, объём]
+        self.retained_ext = {}
 
-                    # Проверяем существование файла и права доступа
-                    if not os.path.exists(file_path) or not os.access(file_path, os.R_OK | os.W_OK):
-                        self.logger.warning(f"Файл {file_path} не существует или недоступен — пропускаем.")
-                        continue
 
-                    # Проверяем, соответствует ли файл шаблонам Mask
-                    if not any(fnmatch.fnmatch(file_name.lower(), pattern.lower()) for pattern in mask_patterns):
-                        continue
+    @classmethod
+    def get_extension(cls, name):
+        """
+        Расширение файла в нижнем регистре; номера ротации (app.log.1, app.log.2) объединяются в ".N".
+        """
+        extension = os.path.splitext(name)[1].lower()
+        if extension[1:].isdigit():
+            return ".N"
+        return extension or cls.NO_EXTENSION
 
-                    try:
-                        creation_date = datetime.datetime.fromtimestamp(self.get_creation_time(file_path))
-                        if creation_date < date:
-                            self.safe_remove(file_path)
-                    except PermissionError as e:
-                        self.logger.error(f"Ошибка доступа при обработке файла {file_path}: {e}")
-                    except FileNotFoundError:
-                        self.logger.warning(f"Файл не найден: {file_path}")
-                    except Exception as e:
-                        self.logger.error(f"Ошибка при обработке файла {file_path}: {e}")
 
-                # Сброс таймера после обработки каждого каталога (опционально)
-                time_checker.reset_timer()
+    @staticmethod
+    def add_total(totals, key, size):
+        total = totals.get(key)
+        if total is None:
+            totals[key] = [1, size]
+        else:
+            total[0] += 1
+            total[1] += size
+
 
-        except Exception as e:
-            self.logger.error(f"Ошибка при обработке пути {path}: {e}")
-        finally:
-            # Останавливаем time_checker после завершения
-            time_checker.stop_event.set()
-            time_checker.join()
-    
+    def add_removed(self, path, size, is_dir=False):
+        self.removed_dirs.add(os.path.dirname(path), size)
+        self.add_total(self.removed_ext, self.DIRECTORY if is_dir else self.get_extension(os.path.basename(path)), size)
 
-    def get_mask_patterns(self, path):
+
+    def add_retained(self, directory, files):
         """
-        Метод возвращает список шаблонов (Mask) для заданного пути из файла конфигурации values.ini.
-        Если шаблоны не указаны, используется значение *.*, что означает удаление всех файлов.
+        Метод учитывает оставленные файлы каталога: files - пары (имя, размер).
         """
-        section = None
-        for sec in self.values_config.sections():
-            if os.path.normcase(os.path.expandvars(self.values_config.get(sec, "Path").strip('"'))) == os.path.normcase(path):
-                section = sec
-                break
+        directory_size = 0
+        for name, size in files:
+            self.add_total(self.retained_ext, self.get_extension(name), size)
+            directory_size += size
+        if directory_size:
+            self.retained_dirs.add(directory, directory_size)
 
-        if section and "Mask" in self.values_config[section]:
-            mask_str = self.values_config[section]["Mask"]
-            return [pattern.strip() for pattern in mask_str.split(",") if pattern.strip()]
-        return ["*.*"]  # Если нет Mask, удаляем все файлы
 
+    def top_extensions(self, totals):
+        return heapq.nlargest(self.top_n, totals.items(), key=lambda item: item[1][1])
 
-    def start_mr_clean(self):
+
+    def snapshot(self):
+        return {
+            "removed_dirs": [{"path": path, "bytes": size} for path, size in self.removed_dirs.top()],
+            "retained_dirs": [{"path": path, "bytes": size} for path, size in self.retained_dirs.top()],
+            "removed_extensions": [{"extension": ext, "count": count, "bytes": size} for ext, (count, size) in self.top_extensions(self.removed_ext)],
+            "retained_extensions": [{"extension": ext, "count": count, "bytes": size} for ext, (count, size) in self.top_extensions(self.retained_ext)],
+        }
+
+
+    def format(self):
         """
-        Метод является основной точкой входа для запуска процесса очистки.
-        Он перебирает все секции файла values.ini, применяет соответствующие методы очистки и логирует результаты.
+        Метод возвращает строки отчёта для журнала.
         """
-        self.logger.info(f"{self.PROGRAM_NAME} v{self.PROGRAM_VERSION}")
-        self.logger.debug(f"Основной метод для запуска очистки.")
+        lines = []
+        for title, top in (("удалённых", self.removed_dirs.top()), ("оставленных", self.retained_dirs.top())):
+            if top:
+                lines.append(f"Каталоги с наибольшим объёмом {title} файлов:")
+                lines.extend(f"  {format_size(size)} - {path}" for path, size in top)
+        for title, totals in (("удалено", self.removed_ext), ("оставлено", self.retained_ext)):
+            if totals:
+                lines.append(f"По расширениям ({title}): " + "; ".join(
+                    f"{ext} - {count} шт., {format_size(size)}" for ext, (count, size) in self.top_extensions(totals)
+                ))
+        return lines
 
-        methods = ["Методы:",
-            "0 - удаляет файлы и каталоги с вложенными файлами.",
-            "1 - удаляет только каталоги с вложенными файлами.",
-            "2 - удаляет только файлы по указанному пути.",
-            "3 - удаляет только файлы в подкаталогах, но не сами подкаталоги.",
-            "4 - удаляет все файлы в каталоге и в подкаталогах, с сохранением структуры каталогов.",
-            "Начало очистки"]
-        for method in methods:
-            self.logger.info(method)
 
-        self.clean_logs_folder()
 
-        for section in self.values_config.sections():
-            if self.is_forced_exit:  # Проверяем флаг остановки
-                return
+class ProgressReporter(threading.Thread):
+    """
+    Периодический вывод хода запуска: строка состояния окна и подсказка иконки в трее обновляются
+    раз в progress-interval секунд, в режиме headless строка выводится в консоль раз в CONSOLE_INTERVAL секунд.
+    """
+    CONSOLE_INTERVAL = 10
 
-            path = os.path.expandvars(self.values_config.get(section, "Path").strip('"'))
-            method = self.values_config.get(section, "Method")
-            days = int(self.values_config.get(section, "Days"))
-            date = datetime.datetime.now() - datetime.timedelta(days=days)
-            mask_patterns = self.get_mask_patterns(path)  # Получаем значение Mask для текущего пути
+    def __init__(self, mr_clean, progress, interval):
+        super().__init__(daemon=True)
+        self.mr_clean = mr_clean
+        self.progress = progress
+        self.interval = max(interval, 0.1)
+        self.stop_event = threading.Event()
 
-            self.logger.info("~ ~ ~ ~ ~ ~ ~ ~ ~ ~")
-            if not os.path.exists(path):
-                self.logger.warning(f"Каталог {path} не найден.")
-                continue
 
-            self.logger.info(
-                f"Сканируется каталог: {path}." +
-                f" Метод: {method}." +
-                f" Период хранения: {days} {get_days_ending(days)}." +
-                f" Маска: {", ".join(mask_patterns)}."
-            )
+    def run(self):
+        last_console = time.monotonic()
+        while not self.stop_event.wait(self.interval):
+            text = self.progress.format()
+            self.mr_clean.show_progress(text)
+            if self.mr_clean.headless and time.monotonic() - last_console >= self.CONSOLE_INTERVAL:
+                print(text)  # Вывод в консоль
+                last_console = time.monotonic()
+
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+
+class ControlServer(threading.Thread):
+    """
+    Локальный сервер управления на Unix-сокете. Протокол - JSON, одна строка на запрос и одна на ответ:
+    {"command": "status"} -> {"ok": true, "result": {...}} или {"ok": false, "error": "..."}.
+    Команды: status, metrics, run ("sections" - список секций, без него - все секции; только в резидентном режиме),
+    cancel (прервать текущий запуск), reload (перечитать конфигурацию), stop (завершить программу, как кнопка "Выход"),
+    quarantine (список элементов карантина), restore ("path" - исходный путь элемента, возвращаемого из карантина).
+    Сетевые подключения не принимаются, файл сокета доступен только владельцу.
+    Каждое подключение обслуживается в отдельном потоке, поэтому медленный или бездействующий клиент не задерживает остальных.
+    """
+    COMMANDS = ("status", "metrics", "run", "cancel", "reload", "stop", "quarantine", "restore")
+    MAX_CLIENTS = 16  # Одновременных подключений; остальным сразу возвращается ошибка
+    CLIENT_TIMEOUT = 5  # Время ожидания запроса от клиента, секунды
+
+    def __init__(self, mr_clean, socket_path):
+        super().__init__(daemon=True)
+        self.mr_clean = mr_clean
+        self.socket_path = socket_path
+        self.stop_event = threading.Event()
+        self.clients = threading.BoundedSemaphore(self.MAX_CLIENTS)
+        self.server = self.bind()
+
+
+    def bind(self):
+        """
+        Метод создаёт сокет. Оставшийся после аварийного завершения файл сокета удаляется,
+        если к нему никто не подключён; работающий экземпляр программы не перехватывается.
+        """
+        if os.path.exists(self.socket_path):
+            if not stat.S_ISSOCK(os.stat(self.socket_path).st_mode):
+                raise FileExistsError(f"{self.socket_path} существует и не является сокетом")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(self.socket_path)
+                except OSError:
+                    os.remove(self.socket_path)
+                else:
+                    raise RuntimeError("сокет используется другим экземпляром программы")
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(self.socket_path)
+            os.chmod(self.socket_path, 0o600)
+            server.listen(4)
+            server.settimeout(0.5)  # Периодическая проверка флага остановки
+        except OSError:
+            server.close()
+            raise
+        return server
 
+
+    def run(self):
+        """
+        Метод принимает подключения и передаёт каждое в отдельный поток.
+        """
+        while not self.stop_event.is_set():
             try:
-                if method == "0":
-                    self.delete_files_and_folders(path, date)
-                elif method == "1":
-                    self.delete_only_folders(path, date)
-                elif method == "2":
-                    self.delete_only_files(path, date, mask_patterns)
-                elif method == "3":
-                    self.delete_files_in_subfolders(path, date, mask_patterns)
-                elif method == "4":
-                    self.delete_only_files_in_folder(path, date, mask_patterns)
-            except Exception as e:
-                self.logger.error(f"Ошибка при обработке секции {section}: {e}")
-        
-        # Автоматическое завершение программы после завершения очистки
-        self.tray_stop_mr_clean(self.icon, exit_source="auto")
+                connection, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not self.clients.acquire(blocking=False):
+                with connection:
+                    try:
+                        connection.sendall((json.dumps({"ok": False, "error": "слишком много подключений"}, ensure_ascii=False) + "\n").encode("utf-8"))
+                    except OSError:
+                        pass
+                continue
+            threading.Thread(target=self.serve, args=(connection,), daemon=True).start()
 
 
-    def create_default_configs(self):
+    def serve(self, connection):
         """
-        Метод создаёт файлы конфигурации config.cfg и values.ini с параметрами по умолчанию, если они отсутствуют в рабочей директории.
+        Метод обрабатывает запросы одного клиента до закрытия соединения или истечения времени ожидания.
         """
-        # Определение базовой директории
-        if hasattr(sys, "_MEIPASS"):
-            # Если программа запущена как .exe (PyInstaller)
-            base_path = Path(sys._MEIPASS)  # Путь к временной директории
-            output_dir = Path(os.path.dirname(sys.executable))  # Директория, где находится .exe
-        else:
-            # Если программа запущена как скрипт
-            base_path = Path(os.path.abspath("."))
-            output_dir = base_path
+        try:
+            with connection:
+                connection.settimeout(self.CLIENT_TIMEOUT)
+                with connection.makefile("r", encoding="utf-8") as reader:
+                    for line in reader:
+                        if line.strip():
+                            response = json.dumps(self.handle(line), ensure_ascii=False) + "\n"
+                            connection.sendall(response.encode("utf-8"))
+        except (OSError, UnicodeDecodeError) as e:
+            self.mr_clean.logger.debug(f"Соединение с клиентом управления прервано: {e}")
+        finally:
+            self.clients.release()
 
-        # Путь к config.cfg
-        config_file_path = output_dir / "config.cfg"
-        if not config_file_path.exists():
-            self.logger.info(f"Файл config.cfg не найден. Создание файла с параметрами по умолчанию.")
-            default_config_content = """\
-[SETTINGS]
-# Максимальное время (в секундах), которое программа может тратить на обработку одного каталога или подкаталога.
-cycle-time-limit-sec = 180
 
-[LOG]
-# Включение (True) или отключение (False) логирования.
-logging = True
-# Уровень детализации логов. Доступные значения: DEBUG, INFO, WARNING, ERROR, CRITICAL
-log-level = INFO
-# Все логи старше указанного количества дней будут автоматически удалены.
-log-days-limit = 7
-"""
-            with open(config_file_path, "w", encoding="utf-8") as config_file:
-                config_file.write(default_config_content)
+    def handle(self, line):
+        """
+        Метод выполняет одну команду и возвращает ответ.
+        """
+        try:
+            request = json.loads(line)
+            command = request.get("command") if isinstance(request, dict) else None
+            if command not in self.COMMANDS:
+                raise ValueError(f"неизвестная команда {command}. Доступные команды: {', '.join(self.COMMANDS)}")
+            self.mr_clean.logger.debug(f"Команда управления: {command}")
+            return {"ok": True, "result": getattr(self, f"command_{command}")(request)}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
 
-        # Путь к values.ini
-        values_file_path = output_dir / "values.ini"
-        if not values_file_path.exists():
-            self.logger.info(f"Файл values.ini не найден. Создание файла с параметрами по умолчанию.")
-            default_values_content = """\
-# Методы:
-# 0 - удаляет файлы и каталоги с вложенными файлами.
-# 1 - удаляет только каталоги с вложенными файлами.
-# 2 - удаляет только файлы по указанному пути.
-# 3 - удаляет только файлы в подкаталогах, но не сами подкаталоги.
-# 4 - удаляет все файлы в каталоге и в подкаталогах, с сохранением структуры каталогов.
 
-# Произвольное имя секции
-[Folder Logs]
-# Путь к очищаемому каталогу
-Path = "C:\\Logs"
-# Метод удаления
-Method = 2
-# Количество дней, за которые нужно оставить каталоги и файлы и не удалять их
-Days = 7
-# Удаление файлов на основе масок имён и расширений
-Mask = *.log
+    def command_status(self, request):
+        return self.mr_clean.get_status()
 
-[Folder_Temp]
-Path = %%TEMP%%
-Method = 4
-Days = 30
-Mask = *.tmp, *.log
-"""
-            with open(values_file_path, "w", encoding="utf-8") as values_file:
-                values_file.write(default_values_content)
 
-        # Добавляем задержку для завершения записи файлов
-        time.sleep(1)  # Задержка в 1 секунду
+    def command_metrics(self, request):
+        return self.mr_clean.get_metrics()
+
+
+    def command_run(self, request):
+        if not self.mr_clean.daemon:
+            raise ValueError("запуск по команде доступен только в резидентном режиме")
+        sections = request.get("sections")
+        if sections is not None and not (isinstance(sections, list) and all(isinstance(section, str) for section in sections)):
+            raise ValueError("sections должен быть списком имён секций")
+        known = {rule.section for rule in self.mr_clean.rule_table}
+        unknown = [section for section in sections or [] if section not in known]
+        if unknown:
+            raise ValueError(f"неизвестные секции: {', '.join(unknown)}")
+        self.mr_clean.request_run(sections)
+        return {"queued": sections or "all"}
+
+
+    def command_cancel(self, request):
+        return {"cancelled": self.mr_clean.cancel_run()}
+
+
+    def command_reload(self, request):
+        self.mr_clean.reload_config(force=True)
+        return {"sections": [rule.section for rule in self.mr_clean.rule_table]}
+
+
+    def command_quarantine(self, request):
+        if not self.mr_clean.quarantine:
+            raise ValueError("карантин не включён")
+        return [dict(manifest, path=item_path) for item_path, manifest in self.mr_clean.quarantine.items()]
+
+
+    def command_restore(self, request):
+        if not self.mr_clean.quarantine:
+            raise ValueError("карантин не включён")
+        return {"restored": self.mr_clean.quarantine.restore(request["path"])}
+
+
+    def command_stop(self, request):
+        # Завершение выполняется в отдельном потоке, чтобы клиент успел получить ответ
+        threading.Thread(target=self.mr_clean.tray_stop_mr_clean, args=(self.mr_clean.icon, "manual"), daemon=True).start()
+        return {"stopping": True}
+
+
+    def close(self):
+        """
+        Метод останавливает сервер и удаляет файл сокета.
+        """
+        self.stop_event.set()
+        try:
+            self.server.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        except OSError as e:
+            self.mr_clean.logger.debug(f"Ошибка при остановке сервера управления: {e}")
 
 
 
@@ -832,7 +4501,7 @@ class TimeChecker(threading.Thread):
     
 class MainWindow(wx.Frame):
     def __init__(self, parent, title, log_level, mr_clean_instance):
-        super(MainWindow, self).__init__(parent, title=title, size=(800, 600), 
+        super(MainWindow, self).__init__(parent, title=title, size=(800, 625), 
                                          style=wx.DEFAULT_FRAME_STYLE & ~wx.RESIZE_BORDER & ~wx.MAXIMIZE_BOX)
         
         # Сохраняем ссылку на экземпляр Mr_Clean
@@ -861,6 +4530,10 @@ class MainWindow(wx.Frame):
             style=wx.TE_MULTILINE | wx.TE_READONLY | wx.HSCROLL
         )
 
+        # Строка состояния с ходом очистки
+        self.CreateStatusBar()
+        self.SetStatusText("Ожидание запуска очистки.")
+
         # Устанавливаем иконку для окна
         self.set_icon()
 
@@ -877,6 +4550,14 @@ class MainWindow(wx.Frame):
         self.SetIcon(icon)
 
 
+    def set_status(self, text):
+        """
+        Обновляет строку состояния (вызывается из главного потока через wx.CallAfter).
+        """
+        if self:  # Окно могло быть закрыто до обработки события
+            self.SetStatusText(text)
+
+
     def on_close(self, event):
         """
         Метод скрывает главное окно программы при нажатии кнопки "Закрыть".
@@ -931,28 +4612,68 @@ if __name__ == "__main__":
         logging.debug(f"Текущая директория .exe-файла: {Path(resource_path(".", is_output_dir=True))}")
         logging.debug(f"Текущая временная директория: {Path(resource_path("."))}")
 
-        scraper = Mr_Clean()
+        parser = argparse.ArgumentParser(description="Mr. Clean — автоматическая очистка файлов и каталогов.")
+        parser.add_argument("--daemon", action="store_true", default=None, help="резидентный режим с запуском секций по расписанию")
+        parser.add_argument("--headless", action="store_true", default=None, help="работа без окна и иконки в трее")
+        parser.add_argument("--control", choices=ControlServer.COMMANDS, help="отправить команду запущенному экземпляру программы")
+        parser.add_argument("--section", action="append", help="секция для команды run (можно указать несколько раз)")
+        parser.add_argument("--path", help="исходный путь элемента для команды restore или маска пути для --journal")
+        parser.add_argument("--journal", action="store_true", help="вывести записи журнала удалений (с отбором по --section, --since, --path)")
+        parser.add_argument("--since", help="записи журнала не старше указанного периода (h - часы, d - дни, w - недели)")
+        args = parser.parse_args()
+
+        if args.journal:  # Просмотр журнала удалений: программа не запускается
+            config = configparser.ConfigParser()
+            config.read(resource_path("config.cfg", is_output_dir=True), encoding="utf-8")
+            journal_path = get_journal_path(config)
+            if not journal_path or not os.path.exists(journal_path):
+                print("Журнал удалений не найден: параметр journal в config.cfg отключён или удалений ещё не было.")
+                sys.exit(1)
+            query_journal(journal_path, args.section, args.since, args.path)
+            sys.exit(0)
+
+        if args.control:  # Клиент сервера управления: программа не запускается, выводится ответ сервера
+            config = configparser.ConfigParser()
+            config.read(resource_path("config.cfg", is_output_dir=True), encoding="utf-8")
+            socket_path = get_control_socket_path(config)
+            if not socket_path:
+                print("Сервер управления отключён: параметр control-socket в config.cfg не задан.")
+                sys.exit(1)
+            params = {"sections": args.section} if args.section else {}
+            if args.path:
+                params["path"] = args.path
+            response = send_control_command(socket_path, args.control, **params)
+            print(json.dumps(response, ensure_ascii=False, indent=2))
+            sys.exit(0 if response.get("ok") else 1)
+
+        scraper = Mr_Clean(daemon=args.daemon, headless=args.headless)
 
         # Создаём потоки
-        thread1 = threading.Thread(target=scraper.icon.run)
+        thread1 = threading.Thread(target=scraper.icon.run) if scraper.icon else None
         thread2 = threading.Thread(target=scraper.start_mr_clean)
 
         # Запускаем потоки
-        thread1.start()
+        if thread1:
+            thread1.start()
         thread2.start()
 
-        # Запускаем цикл событий wxPython
-        scraper.app.MainLoop()
+        if scraper.app:  # Запускаем цикл событий wxPython
+            scraper.app.MainLoop()
 
         # Ожидаём завершения второго потока (основной очистки)
-        thread2.join()
+        try:
+            while thread2.is_alive():
+                thread2.join(0.5)
+        except KeyboardInterrupt:  # Ctrl+C в режиме headless
+            scraper.tray_stop_mr_clean(scraper.icon, exit_source="manual")
+            thread2.join()
         if scraper.icon and scraper.icon.visible:
             try:  # Останавливаем иконку в трее
                 scraper.icon.stop()  # Останавливаем иконку в трее, если выход не принудительный
             except Exception as e:
                 logging.debug(f"Ошибка при остановке иконки в трее: {e}")     
         
-        if not threading.current_thread() is threading.main_thread():
+        if thread1 and not threading.current_thread() is threading.main_thread():
             thread1.join()
         
         scraper.logger.debug(f"Завершение программы.")